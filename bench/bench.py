@@ -0,0 +1,480 @@
+# Host benchmark for the device scripts
+# Runs the servers under CPython against the fake hardware backend (hal)
+# and drives them over loopback:
+#
+#   python bench/bench.py                  # every script
+#   python bench/bench.py esp_drone.py -n 2000
+#   python bench/bench.py --json baseline.json
+#
+# For each endpoint it reports requests per second and p50/p99 latency over
+# one keep-alive connection, the bytes on the wire per request (request +
+# response) and the bytes allocated while handling one request. Allocation
+# is measured in-process with tracemalloc, without any socket in the way,
+# as the peak above the starting point; it is the host analogue of
+# watching gc.mem_alloc() on the board. The fake backend adds the register
+# writes per request and their modelled cost in microseconds.
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import struct
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import hal  # noqa: E402  (needs the path set up above)
+import webserver  # noqa: E402
+
+board = hal.install()
+
+# Endpoints per script, hit in this order
+HTTP_SCRIPTS = {
+    'main.py': ['/', '/forward', '/left', '/stop'],
+    'rc-car.py': ['/', '/app.css', '/app.js', '/forward', '/accelerate', '/stop'],
+    'relay-control.py': ['/', '/app.js', '/status', '/led/on', '/relay1/on'],
+    'esp_drone.py': ['/', '/app.js', '/status', '/motors/on', '/adjust/1/500', '/set?m=200,210,190,205',
+                     '/led/on'],
+}
+# Stick positions (left_x, left_y, right_x, right_y) sent to UDP scripts
+UDP_SCRIPTS = {
+    'drone_udp.py': [(1500, 1500, 1500, 1500), (1800, 1400, 1600, 1500), (1200, 1700, 1500, 1300)],
+}
+
+
+class Result:
+    def __init__(self, script, endpoint, times, wire, alloc, writes, hw_us):
+        times = sorted(times)
+        self.script = script
+        self.endpoint = endpoint
+        self.count = len(times)
+        self.rate = len(times) / (sum(times) / 1e9)
+        self.p50 = times[(len(times) - 1) // 2] / 1000
+        self.p99 = times[(len(times) - 1) * 99 // 100] / 1000
+        self.wire = wire
+        self.alloc = alloc
+        self.writes = writes
+        self.hw_us = hw_us
+
+    def row(self):
+        return '{:<17} {:<15} {:>9.0f} {:>9.1f} {:>9.1f} {:>8.0f} {:>8.0f} {:>7.1f} {:>7.0f}'.format(
+            self.script, self.endpoint, self.rate, self.p50, self.p99, self.wire, self.alloc,
+            self.writes, self.hw_us)
+
+    def as_dict(self):
+        return {'script': self.script, 'endpoint': self.endpoint, 'count': self.count,
+                'req_per_s': round(self.rate, 1), 'p50_us': round(self.p50, 1),
+                'p99_us': round(self.p99, 1), 'wire_bytes': round(self.wire, 1),
+                'alloc_bytes': round(self.alloc, 1), 'writes': round(self.writes, 2),
+                'hw_us': round(self.hw_us, 1)}
+
+
+HEADER = '{:<17} {:<15} {:>9} {:>9} {:>9} {:>8} {:>8} {:>7} {:>7}'.format(
+    'script', 'endpoint', 'req/s', 'p50 us', 'p99 us', 'wire B', 'alloc B', 'writes', 'hw us')
+
+
+def load(script):
+    """Run a device script up to its server loop; returns (namespace, handler)
+
+    webserver.serve is swapped for a stub that only records the handler,
+    so the script's asyncio.run(...) returns instead of serving forever.
+    """
+    captured = []
+
+    async def capture(handler, host='0.0.0.0', port=80):
+        captured.append(handler)
+
+    path = os.path.join(ROOT, script)
+    with open(path) as f:
+        source = f.read()
+    namespace = {'__name__': '__bench__', '__file__': path, 'bytearray': board.bytearray}
+    serve = webserver.serve
+    webserver.serve = capture
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(compile(source, path, 'exec'), namespace)
+            if not captured and 'setup' in namespace:
+                namespace['setup']()  # Scripts that only start under __main__
+    finally:
+        webserver.serve = serve
+    return namespace, captured[0] if captured else None
+
+
+def run_now(coro):
+    """Run a coroutine that never really suspends, without an event loop"""
+    try:
+        coro.send(None)
+    except StopIteration:
+        return
+    coro.close()
+    raise RuntimeError('handler suspended; cannot measure it in-process')
+
+
+def measure_alloc(prepare, work, n):
+    """Mean peak bytes allocated by work() above the starting point"""
+    tracemalloc.start()
+    total = 0
+    for _ in range(n):
+        prepare()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        work()
+        total += tracemalloc.get_traced_memory()[1] - start
+    tracemalloc.stop()
+    return total / n
+
+
+class _Sink:
+    """Writer that discards, for in-process handler runs"""
+
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+def http_alloc(handler, request, n):
+    req = webserver.Request(None, _Sink())
+
+    def prepare():
+        req.clear()
+        req.buf[:len(request)] = request
+        req.length = len(request)
+        req._scan()
+
+    async def noop(req):
+        pass
+
+    # Creating and running the coroutine is overhead of the measurement
+    overhead = measure_alloc(prepare, lambda: run_now(noop(req)), n)
+    prepare()
+    run_now(handler(req))  # Warm up lazily built caches
+    return max(0.0, measure_alloc(prepare, lambda: run_now(handler(req)), n) - overhead)
+
+
+def _content_length(head):
+    for line in head.split(b'\r\n'):
+        if line[:15].lower() == b'content-length:':
+            return int(line[15:])
+    return 0
+
+
+async def bench_http(script, handler, paths, n):
+    server = await asyncio.start_server(
+        lambda reader, writer: webserver._serve_client(handler, reader, writer), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    results = []
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for path in paths:
+            request = 'GET {} HTTP/1.1\r\nHost: bench\r\n\r\n'.format(path).encode()
+            times = []
+            wire = 0
+            board.clear()
+            for _ in range(n):
+                start = time.perf_counter_ns()
+                writer.write(request)
+                head = await reader.readuntil(b'\r\n\r\n')
+                body = await reader.readexactly(_content_length(head))
+                times.append(time.perf_counter_ns() - start)
+                wire += len(request) + len(head) + len(body)
+                if b'connection: close' in head.lower():
+                    writer.close()
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writes, hw_us = len(board.log) / n, board.busy_us / n
+            alloc = http_alloc(handler, request, n)
+            results.append(Result(script, path, times, wire / n, alloc, writes, hw_us))
+    finally:
+        writer.close()
+        server.close()
+    return results
+
+
+def bench_udp(script, namespace, sticks, n):
+    """Loopback packets through the script's own socket, parse and mix
+
+    One row for the binary packet format and one for the legacy ASCII one.
+    """
+    server = namespace['udp_socket']
+    port = server.getsockname()[1]
+    receive = namespace['receive_packet']
+    parse = namespace['parse_packet']
+    apply = namespace['apply_packet']
+    buf = namespace['packet_buf']
+    encodings = (
+        ('udp binary', [namespace['pack_packet'](*s, seq=i) for i, s in enumerate(sticks)]),
+        ('udp ascii', ['{:04d}{:04d}{:04d}{:04d}'.format(*s).encode() for s in sticks]),
+    )
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    results = []
+    try:
+        for label, packets in encodings:
+            times = []
+            wire = 0
+            board.clear()
+            for i in range(n):
+                packet = packets[i % len(packets)]
+                start = time.perf_counter_ns()
+                client.sendto(packet, ('127.0.0.1', port))
+                apply(parse(buf, receive()))
+                times.append(time.perf_counter_ns() - start)
+                wire += len(packet)
+            writes, hw_us = len(board.log) / n, board.busy_us / n
+            packet = packets[1]
+
+            def prepare():
+                buf[:len(packet)] = packet
+
+            alloc = measure_alloc(prepare, lambda: apply(parse(buf, len(packet))), n)
+            results.append(Result(script, label, times, wire / n, alloc, writes, hw_us))
+
+        if 'drain_packets' in namespace:
+            results.append(bench_drain(script, namespace, client, port, sticks, n))
+        if 'control_tick' in namespace:
+            results.append(bench_tick(script, namespace, sticks, n))
+        if 'THRUST_TABLE' in namespace:
+            results.extend(bench_mix(script, namespace, sticks, n))
+    finally:
+        client.close()
+    return results
+
+
+BURST = 8  # Packets queued per control cycle in the drain benchmark
+
+
+def bench_drain(script, namespace, client, port, sticks, n):
+    """Bursts of BURST packets per cycle, drained so only the newest applies"""
+    server = namespace['udp_socket']
+    drain = namespace['drain_packets']
+    apply = namespace['apply_packet']
+    packets = [namespace['pack_packet'](*sticks[i % len(sticks)], seq=i) for i in range(256)]
+    server.setblocking(False)
+    seq = 0
+
+    def send_burst():
+        nonlocal seq
+        for _ in range(BURST):
+            seq = (seq + 1) & 0xFF
+            client.sendto(packets[seq], ('127.0.0.1', port))
+
+    def cycle():
+        packet = drain()
+        if packet is not False:
+            apply(packet)
+
+    times = []
+    board.clear()
+    for _ in range(n):
+        start = time.perf_counter_ns()
+        send_burst()
+        cycle()
+        times.append(time.perf_counter_ns() - start)
+    writes, hw_us = len(board.log) / n, board.busy_us / n
+    alloc = measure_alloc(send_burst, cycle, n)
+    server.setblocking(True)
+    return Result(script, 'udp drain x{}'.format(BURST), times, BURST * len(packets[0]),
+                  alloc, writes, hw_us)
+
+
+def bench_tick(script, namespace, sticks, n):
+    """Cost of one fixed-rate control loop step with a live setpoint"""
+    tick = namespace['control_tick']
+    namespace['set_setpoint'](tuple(sticks[1]) + (0, 0))
+    times = []
+    board.clear()
+    for _ in range(n):
+        start = time.perf_counter_ns()
+        tick()
+        times.append(time.perf_counter_ns() - start)
+    writes, hw_us = len(board.log) / n, board.busy_us / n
+    alloc = measure_alloc(lambda: None, tick, n)
+    return Result(script, 'control tick', times, 0, alloc, writes, hw_us)
+
+
+LONG_SILENCE_US = 540 * 1000000  # Past half the ticks_us period (2**29 us)
+
+
+def check_link_loss(namespace):
+    """Control loop without a radio; returns the problems found
+
+    The motors must rest before the first packet, ramp to rest after the
+    link drops, and stay there after a silence long enough for a diff
+    against the last packet time to wrap.
+    """
+    stop = list(namespace['STOP_STICKS'])
+    output = namespace['output']
+    motors = namespace['motors']
+    problems = []
+
+    def expect(when, want):
+        if list(output) != want:
+            problems.append('{}: sticks {}, expected {}'.format(when, list(output), want))
+        elif want == stop and any(m.duty() for m in motors):
+            problems.append('{}: duty {}, expected 0'.format(when, [m.duty() for m in motors]))
+
+    timer = namespace['start_control_loop']()
+    board.advance(1000000)
+    expect('no packet yet', stop)
+    sticks = [1500, 1900, 1500, 1500]
+    namespace['set_setpoint'](tuple(sticks) + (0, 0))
+    board.advance(100000)
+    expect('link up', sticks)
+    board.advance(2000000)
+    expect('link lost', stop)
+    timer.deinit()
+    board.advance(LONG_SILENCE_US)
+    timer = namespace['start_control_loop']()
+    board.advance(100000)
+    expect('long silence', stop)
+    timer.deinit()
+    board.clear()
+    return problems
+
+
+def bench_udp_drive(script, namespace, sticks, n):
+    """UDP joystick packets beside an HTTP UI: datagram to pin writes"""
+    port = namespace['udp_socket'].getsockname()[1]
+    poll = namespace['poll_udp']
+    packets = [struct.pack(namespace['PACKET_FORMAT'], *s, 0, 0) for s in sticks]
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    times = []
+    board.clear()
+    try:
+        for i in range(n):
+            packet = packets[i % len(packets)]
+            start = time.perf_counter_ns()
+            client.sendto(packet, ('127.0.0.1', port))
+            poll()
+            times.append(time.perf_counter_ns() - start)
+        writes, hw_us = len(board.log) / n, board.busy_us / n
+        packet = packets[1]
+
+        def prepare():
+            client.sendto(packet, ('127.0.0.1', port))
+
+        alloc = measure_alloc(prepare, poll, n)
+    finally:
+        client.close()
+    return Result(script, 'udp drive', times, len(packets[0]), alloc, writes, hw_us)
+
+
+def arithmetic_mixer(namespace):
+    """The quad mix as computed before the lookup tables, for comparison
+
+    Returns (mix, control_motors): the four map_value calls and clamps
+    alone, and the same wrapped in control_motors' probe marks and output
+    stage, so both rows time the same work as the script's own path.
+    """
+    map_value = namespace['map_value']
+    low, high = namespace['JOYSTICK_MIN'], namespace['JOYSTICK_MAX']
+    mid = namespace['PWM_MID']
+    probes, outputs = namespace['probes'], namespace['outputs']
+    mix_stage, duty_stage = namespace['MIX'], namespace['DUTY']
+    speeds = [0] * 4
+
+    def mix(left_x, left_y, right_x, right_y):
+        thrust = map_value(left_y, low, high, 0, 1023)
+        rotation = map_value(left_x, low, high, -mid, mid)
+        trim_x = map_value(right_x, low, high, -100, 100)
+        trim_y = map_value(right_y, low, high, -100, 100)
+        speeds[0] = max(0, min(1023, thrust - rotation + trim_y - trim_x))
+        speeds[1] = max(0, min(1023, thrust + rotation + trim_y + trim_x))
+        speeds[2] = max(0, min(1023, thrust - rotation - trim_y - trim_x))
+        speeds[3] = max(0, min(1023, thrust + rotation - trim_y + trim_x))
+        return speeds
+
+    def control_motors(left_x, left_y, right_x, right_y):
+        t = probes.start()
+        mix(left_x, left_y, right_x, right_y)
+        t = probes.mark(mix_stage, t)
+        outputs.set_all(speeds)
+        probes.mark(duty_stage, t)
+    return mix, control_motors
+
+
+def table_mixer(namespace):
+    """control_motors' table lookups and Mixer.mix alone"""
+    mixer = namespace['mixer']
+    low = namespace['JOYSTICK_MIN']
+    thrust, rotation, trim = (namespace['THRUST_TABLE'], namespace['ROTATION_TABLE'],
+                              namespace['TRIM_TABLE'])
+
+    def mix(left_x, left_y, right_x, right_y):
+        return mixer.mix(thrust[left_y - low], rotation[left_x - low],
+                         trim[right_y - low], trim[right_x - low])
+    return mix
+
+
+def bench_mix(script, namespace, sticks, n):
+    """Joystick-to-duty mixing: the script's tables against arithmetic
+
+    'mix only' rows time the stick mapping and mix alone, 'mix' rows the
+    full control_motors path with probes and the output stage. Each pair
+    does the same work apart from tables against map_value.
+    """
+    arith_mix, arith_control = arithmetic_mixer(namespace)
+    results = []
+    for label, mix in (('mix only', table_mixer(namespace)),
+                       ('mix only arith', arith_mix),
+                       ('mix', namespace['control_motors']),
+                       ('mix arith', arith_control)):
+        namespace['outputs'].invalidate()
+        times = []
+        board.clear()
+        for i in range(n):
+            stick = sticks[i % len(sticks)]
+            start = time.perf_counter_ns()
+            mix(*stick)
+            times.append(time.perf_counter_ns() - start)
+        writes, hw_us = len(board.log) / n, board.busy_us / n
+        alloc = measure_alloc(lambda: None, lambda: mix(*sticks[1]), n)
+        results.append(Result(script, label, times, 0, alloc, writes, hw_us))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the device scripts on the host')
+    parser.add_argument('scripts', nargs='*', help='scripts to run (default: all)')
+    parser.add_argument('-n', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    scripts = args.scripts or list(HTTP_SCRIPTS) + list(UDP_SCRIPTS)
+
+    results = []
+    problems = []
+    print(HEADER)
+    for script in scripts:
+        script = os.path.basename(script)
+        namespace, handler = load(script)
+        if 'control_tick' in namespace:
+            # On the fresh namespace, before any benchmark has sent a packet
+            problems += ['{}: {}'.format(script, p) for p in check_link_loss(namespace)]
+        if script in UDP_SCRIPTS:
+            rows = bench_udp(script, namespace, UDP_SCRIPTS[script], args.n)
+            namespace['udp_socket'].close()
+        else:
+            rows = asyncio.run(bench_http(script, handler, HTTP_SCRIPTS[script], args.n))
+            if 'poll_udp' in namespace:
+                # Scripts with a UDP control mode beside their web UI
+                rows.append(bench_udp_drive(script, namespace, UDP_SCRIPTS['drone_udp.py'], args.n))
+                namespace['udp_socket'].close()
+        for row in rows:
+            print(row.row())
+        results.extend(rows)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([r.as_dict() for r in results], f, indent=1)
+    for problem in problems:
+        print('check failed: ' + problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
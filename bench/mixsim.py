@@ -0,0 +1,114 @@
+# Vectorized host simulation of the motor mixer
+# Evaluates millions of stick samples at once with NumPy, using the same
+# integer mapping and layouts as the device (mixer.py, drone_udp's tables),
+# checks a slice of them against mixer.Mixer and reports the throughput
+# of both:
+#
+#   python bench/mixsim.py                       # quad_x, 2M samples
+#   python bench/mixsim.py --layout hex -n 5000000
+#
+# NumPy is only needed here, on the host.
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mixer  # noqa: E402  (needs the path set up above)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# drone_udp's stick range and axis mappings
+JOYSTICK_MIN = 1000
+JOYSTICK_MAX = 2000
+PWM_MIN = 0
+PWM_MAX = 1023
+PWM_MID = 511
+AXIS_RANGES = ((PWM_MIN, PWM_MAX), (-PWM_MID, PWM_MID), (-100, 100), (-100, 100))
+
+
+def map_axis(sticks, out_min, out_max):
+    """drone_udp.map_value on an array; // floors like the device"""
+    return ((sticks - JOYSTICK_MIN) * (out_max - out_min) // (JOYSTICK_MAX - JOYSTICK_MIN)
+            + out_min)
+
+
+def simulate(layout, sticks):
+    """Motor outputs (samples x motors) for sticks (samples x 4)
+
+    Stick columns are left_x, left_y, right_x, right_y as in the packets.
+    """
+    sticks = sticks.astype(np.int64)
+    axes = np.stack((
+        map_axis(sticks[:, 1], PWM_MIN, PWM_MAX),   # thrust
+        map_axis(sticks[:, 0], -PWM_MID, PWM_MID),  # rotation
+        map_axis(sticks[:, 3], -100, 100),          # pitch (right_y trim)
+        map_axis(sticks[:, 2], -100, 100),          # roll (right_x trim)
+    ), axis=1)
+    coef = np.array(mixer.LAYOUTS[layout], dtype=np.int64)
+    # >> on signed integers floors, like the device's integer shift
+    return np.clip((axes @ coef.T) >> mixer.SHIFT, PWM_MIN, PWM_MAX)
+
+
+def device_mix(layout, sticks):
+    """The same samples through mixer.Mixer, one at a time"""
+    device = mixer.Mixer(mixer.LAYOUTS[layout], AXIS_RANGES, PWM_MIN, PWM_MAX)
+    span = JOYSTICK_MAX - JOYSTICK_MIN
+    results = []
+    for left_x, left_y, right_x, right_y in sticks.tolist():
+        results.append(list(device.mix(
+            (left_y - JOYSTICK_MIN) * (PWM_MAX - PWM_MIN) // span + PWM_MIN,
+            (left_x - JOYSTICK_MIN) * (2 * PWM_MID) // span - PWM_MID,
+            (right_y - JOYSTICK_MIN) * 200 // span - 100,
+            (right_x - JOYSTICK_MIN) * 200 // span - 100)))
+    return np.array(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectorized motor mixer simulation')
+    parser.add_argument('--layout', default='quad_x', choices=sorted(mixer.LAYOUTS))
+    parser.add_argument('-n', type=int, default=2000000, help='stick samples')
+    parser.add_argument('--check', type=int, default=20000,
+                        help='samples compared against mixer.Mixer')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if np is None:
+        sys.exit('mixsim needs NumPy on the host: pip install numpy')
+
+    rng = np.random.default_rng(args.seed)
+    sticks = rng.integers(JOYSTICK_MIN, JOYSTICK_MAX + 1, size=(args.n, 4))
+    # Always include the corners, where clamping matters most
+    corners = np.array([[x, y, x, y] for x in (JOYSTICK_MIN, JOYSTICK_MAX)
+                        for y in (JOYSTICK_MIN, JOYSTICK_MAX)])
+    sticks[:len(corners)] = corners
+
+    start = time.perf_counter()
+    outputs = simulate(args.layout, sticks)
+    vector_s = time.perf_counter() - start
+
+    check = sticks[:min(args.check, args.n)]
+    start = time.perf_counter()
+    expected = device_mix(args.layout, check)
+    device_s = time.perf_counter() - start
+    mismatches = int(np.count_nonzero((outputs[:len(check)] != expected).any(axis=1)))
+
+    print('layout {}: {} motors'.format(args.layout, outputs.shape[1]))
+    print('numpy   {:>12.0f} samples/s ({} samples)'.format(args.n / vector_s, args.n))
+    print('device  {:>12.0f} samples/s ({} samples, mixer.Mixer on CPython)'.format(
+        len(check) / device_s, len(check)))
+    print('mismatches: {} of {}'.format(mismatches, len(check)))
+    print('output min/mean/max per motor:')
+    for motor in range(outputs.shape[1]):
+        column = outputs[:, motor]
+        print('  motor {}: {:4d} {:7.1f} {:4d}'.format(
+            motor + 1, int(column.min()), float(column.mean()), int(column.max())))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
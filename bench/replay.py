@@ -0,0 +1,371 @@
+# Record and replay of control sessions
+# A recording proxy sits between a controller and the board and logs what
+# reaches it: the UDP joystick packets of drone_udp.py, or the HTTP
+# commands of the web-controlled scripts. Replay feeds a log back into the
+# unchanged script on the fake hardware (hal), at the recorded pace or
+# flat-out, times it, and writes the resulting output trace so two code
+# versions can be checked for divergence:
+#
+#   python bench/replay.py record udp -o flight.ctl --target 192.168.4.1
+#   python bench/replay.py record http -o drive.ctl --target 192.168.4.1 --script rc-car.py
+#   python bench/replay.py replay flight.ctl --trace before.txt
+#   python bench/replay.py replay flight.ctl --fast --compare before.txt
+#
+# Log format, little-endian: MAGIC, uint8 name length, the script name,
+# then one entry per message: uint32 microseconds since the previous
+# entry, uint8 kind (UDP or HTTP), uint16 length and the payload. A UDP
+# payload is the datagram as received, an HTTP payload the method and
+# path ('GET /forward'). A drone_udp packet takes 17 bytes.
+#
+# Replay always moves the board's virtual clock by the recorded gaps, so
+# control-loop ticks and link timeouts fall at the same places in both
+# modes and the trace does not depend on host speed.
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import time
+import zlib
+
+import bench
+
+MAGIC = b'CTL1'
+ENTRY_FORMAT = '<IBH'
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+UDP, HTTP = range(2)
+KINDS = ('udp', 'http')
+MAX_GAP_US = 0xFFFFFFFF
+
+DEFAULT_SCRIPT = {UDP: 'drone_udp.py', HTTP: 'rc-car.py'}
+DEFAULT_PORT = {UDP: 50000, HTTP: 80}
+
+
+class LogWriter:
+    """Appends timestamped entries to a log file"""
+
+    def __init__(self, path, script):
+        self.file = open(path, 'wb')
+        name = script.encode()
+        self.file.write(MAGIC + bytes((len(name),)) + name)
+        self.last = time.perf_counter_ns()
+        self.count = 0
+
+    def add(self, kind, payload):
+        now = time.perf_counter_ns()
+        gap = min(MAX_GAP_US, (now - self.last) // 1000)
+        self.last = now
+        self.file.write(struct.pack(ENTRY_FORMAT, gap, kind, len(payload)) + payload)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_log(path):
+    """(script name, [(gap_us, kind, payload)]) of a log file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('{}: not a control log'.format(path))
+    pos = len(MAGIC) + 1
+    script = data[pos:pos + data[len(MAGIC)]].decode()
+    pos += len(script)
+    entries = []
+    while pos < len(data):
+        gap, kind, length = struct.unpack_from(ENTRY_FORMAT, data, pos)
+        pos += ENTRY_SIZE
+        entries.append((gap, kind, data[pos:pos + length]))
+        pos += length
+    return script, entries
+
+
+# Recording proxies
+
+class UdpProxy(asyncio.DatagramProtocol):
+    """Logs datagrams from the controller, forwards both ways"""
+
+    def __init__(self, log, target):
+        self.log = log
+        self.target = target
+        self.transport = None
+        self.controller = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if addr == self.target:
+            if self.controller:
+                self.transport.sendto(data, self.controller)  # Acks, stats replies
+            return
+        self.controller = addr
+        self.log.add(UDP, data)
+        self.transport.sendto(data, self.target)
+
+
+async def record_udp(log, args):
+    loop = asyncio.get_running_loop()
+    target = (socket.gethostbyname(args.target), args.port)
+    await loop.create_datagram_endpoint(lambda: UdpProxy(log, target),
+                                        local_addr=('0.0.0.0', args.listen))
+    await asyncio.Event().wait()
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _log_requests(log, reader, writer):
+    """Forward a client's requests, logging the method and path of each"""
+    pending = b''
+    body = 0  # Bytes of the current request body still to pass through
+    try:
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+            pending += data
+            while True:
+                if body:
+                    skip = min(body, len(pending))
+                    pending = pending[skip:]
+                    body -= skip
+                end = pending.find(b'\r\n\r\n')
+                if body or end < 0:
+                    break
+                head = pending[:end].split(b'\r\n')
+                log.add(HTTP, b' '.join(head[0].split(b' ')[:2]))
+                for line in head[1:]:
+                    if line[:15].lower() == b'content-length:':
+                        body = int(line[15:])
+                pending = pending[end + 4:]
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def record_http(log, args):
+    async def client(reader, writer):
+        try:
+            up_reader, up_writer = await asyncio.open_connection(args.target, args.port)
+        except OSError:
+            writer.close()
+            return
+        await asyncio.gather(_log_requests(log, reader, up_writer), _pipe(up_reader, writer))
+
+    server = await asyncio.start_server(client, '0.0.0.0', args.listen)
+    async with server:
+        await server.serve_forever()
+
+
+def record(args):
+    kind = KINDS.index(args.kind)
+    args.port = args.port or DEFAULT_PORT[kind]
+    args.listen = args.listen or args.port
+    log = LogWriter(args.output, args.script or DEFAULT_SCRIPT[kind])
+    print('recording {} to {}: point the controller at port {}, Ctrl-C to stop'.format(
+        args.kind, args.output, args.listen))
+    try:
+        asyncio.run((record_udp if kind == UDP else record_http)(log, args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.close()
+        print('{} entries'.format(log.count))
+
+
+# Replay
+
+class Capture:
+    """Writer that keeps the response, for in-process handler runs"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+class Replayer:
+    """Feeds log entries into a loaded script and collects its outputs"""
+
+    def __init__(self, script):
+        self.namespace, self.handler = bench.load(script)
+        self.events = []  # Entry results other than register writes
+        ns = self.namespace
+        if 'udp_socket' in ns:
+            self.server = ns['udp_socket']
+            self.server.setblocking(False)
+            self.address = ('127.0.0.1', self.server.getsockname()[1])
+            self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.client.setblocking(False)
+        if 'drain_packets' in ns:
+            if ns['CONTROL_LOOP']:
+                ns['start_control_loop']()
+                self.take = ns['set_setpoint']
+            else:
+                self.take = ns['apply_packet']
+        bench.board.clear()
+        self.start_us = bench.board.now_us
+
+    def udp(self, payload):
+        ns = self.namespace
+        self.client.sendto(payload, self.address)
+        if 'poll_udp' in ns:
+            # UDP control beside a web UI (rc-car.py)
+            ns['poll_udp']()
+            result = 'udp {}'.format(ns['current_state'])
+        else:
+            packet = ns['drain_packets']()
+            if packet is not False:
+                self.take(packet)
+            result = 'udp {}'.format(packet and list(packet))
+        try:
+            while self.client.recv(64):
+                pass  # Acks
+        except OSError:
+            pass
+        return result
+
+    def http(self, payload):
+        request = payload + b' HTTP/1.1\r\nHost: replay\r\n\r\n'
+        req = bench.webserver.Request(None, Capture())
+        req.buf[:len(request)] = request
+        req.length = len(request)
+        req._scan()
+        try:
+            bench.run_now(self.handler(req))
+        except RuntimeError:
+            return 'http {} -> suspends, skipped'.format(payload.decode())
+        except Exception as e:
+            # A handler that fails is an output too: keep it in the trace
+            return 'http {} -> closed-no-response ({})'.format(payload.decode(), type(e).__name__)
+        response = bytes(req.writer.data)
+        status = response[:response.find(b'\r\n')].decode()
+        return 'http {} -> {} {} {:08x}'.format(
+            payload.decode(), status, len(response), zlib.crc32(response))
+
+    def feed(self, kind, payload):
+        """Run one entry; returns its host time in nanoseconds"""
+        start = time.perf_counter_ns()
+        event = self.udp(payload) if kind == UDP else self.http(payload)
+        elapsed = time.perf_counter_ns() - start
+        self.events.append((bench.board.now_us, event))
+        return elapsed
+
+    def lines(self):
+        """Output trace: register writes and entry results, in time order"""
+        # An entry's result is stamped after its writes, so the stable sort
+        # keeps each result below the writes it caused
+        lines = [(t, '{} {} {}'.format(target, kind, value))
+                 for t, target, kind, value in bench.board.log]
+        lines += self.events
+        lines.sort(key=lambda line: line[0])
+        return ['{} {}'.format(t - self.start_us, text) for t, text in lines]
+
+
+def replay(args):
+    script, entries = read_log(args.log)
+    script = args.script or script
+    replayer = Replayer(script)
+    board = bench.board
+
+    times = []
+    ticks_ns = 0
+    start = time.perf_counter()
+    due = start
+    for gap, kind, payload in entries:
+        if not args.fast:
+            due += gap / 1e6
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t = time.perf_counter_ns()
+        board.advance(gap)  # Control ticks that fall in the gap
+        ticks_ns += time.perf_counter_ns() - t
+        times.append(replayer.feed(kind, payload))
+    elapsed = time.perf_counter() - start
+    lines = replayer.lines()
+
+    times.sort()
+    recorded = sum(gap for gap, kind, payload in entries) / 1e6
+    print('{}: {} entries, {:.2f} s recorded, replayed in {:.2f} s ({})'.format(
+        script, len(entries), recorded, elapsed, 'flat-out' if args.fast else 'recorded pace'))
+    if times:
+        print('entries/s {:.0f}  latency p50 {:.1f} us p99 {:.1f} us max {:.1f} us'.format(
+            len(times) / (sum(times) / 1e9), times[(len(times) - 1) // 2] / 1000,
+            times[(len(times) - 1) * 99 // 100] / 1000, times[-1] / 1000))
+    print('control ticks {:.1f} ms host time | writes {} ({} us modelled)'.format(
+        ticks_ns / 1e6, len(board.log), board.busy_us))
+    print('trace digest {:08x}'.format(zlib.crc32('\n'.join(lines).encode())))
+
+    if args.trace:
+        with open(args.trace, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            expected = f.read().splitlines()
+        return compare(expected, lines)
+    return 0
+
+
+def compare(expected, lines):
+    """Report the first line where two traces differ; 1 if they do"""
+    for i, (want, got) in enumerate(zip(expected, lines)):
+        if want != got:
+            print('diverges at trace line {}:'.format(i + 1))
+            print('  expected: {}'.format(want))
+            print('  got:      {}'.format(got))
+            return 1
+    if len(expected) != len(lines):
+        print('trace lengths differ: expected {} lines, got {}'.format(len(expected), len(lines)))
+        return 1
+    print('no divergence ({} lines)'.format(len(lines)))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay control sessions')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rec = commands.add_parser('record', help='log traffic through a proxy')
+    rec.add_argument('kind', choices=KINDS)
+    rec.add_argument('-o', '--output', required=True, help='log file to write')
+    rec.add_argument('--target', default='192.168.4.1', help='address of the board')
+    rec.add_argument('--port', type=int, help='port on the board (default 50000 / 80)')
+    rec.add_argument('--listen', type=int, help='local port (default: same as --port)')
+    rec.add_argument('--script', help='script the log is for (default drone_udp.py / rc-car.py)')
+
+    rep = commands.add_parser('replay', help='feed a log into a script on the fake hardware')
+    rep.add_argument('log')
+    rep.add_argument('--script', help='script to replay into (default: the one recorded)')
+    rep.add_argument('--fast', action='store_true', help='no waiting between entries')
+    rep.add_argument('--trace', help='write the output trace to this file')
+    rep.add_argument('--compare', help='trace of an earlier run to check for divergence')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args)
+    else:
+        sys.exit(replay(args))
+
+
+if __name__ == '__main__':
+    main()
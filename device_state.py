@@ -0,0 +1,47 @@
+# Versioned device state with a cached status response
+# The version is bumped on every state change. The status JSON, and the
+# complete /status response around it, are serialised on the first poll
+# after a change and then reused, so polling an idle device costs no
+# serialisation at all.
+#
+#   state = DeviceState(lambda: {'led': led_state})
+#   ... change something ...
+#   state.changed()
+#   routes.add('/status', state.response)
+import json
+import webserver
+
+
+class DeviceState:
+    """Version counter plus the status snapshot cached per version"""
+
+    def __init__(self, snapshot, on_change=None):
+        # snapshot() returns the state as a dict of JSON-serialisable values;
+        # on_change() is called after every change, e.g. EventSource.notify
+        self.snapshot = snapshot
+        self.on_change = on_change
+        self.version = 0
+        self._json_version = -1
+        self._json = b''
+        self._response_version = -1
+        self._response = b''
+
+    def changed(self):
+        """Call after any state change"""
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change()
+
+    def json(self):
+        """Status JSON as bytes, serialised once per version"""
+        if self._json_version != self.version:
+            self._json = json.dumps(self.snapshot()).encode()
+            self._json_version = self.version
+        return self._json
+
+    def response(self):
+        """Route target: the complete /status response, built once per version"""
+        if self._response_version != self.version:
+            self._response = webserver.response(self.json(), 'application/json')
+            self._response_version = self.version
+        return self._response
@@ -1,6 +1,26 @@
 import network
-from machine import Pin, PWM
+from machine import Pin, PWM, Timer
 import socket
+import json
+from mixer import Mixer, LAYOUTS
+from output_stage import OutputStage
+from probes import Probes
+try:
+    import utime as time
+except ImportError:
+    import time
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    import uselect as select
+except ImportError:
+    import select
+try:
+    from uarray import array
+except ImportError:
+    from array import array
 
 led = Pin(2, Pin.OUT)
 led.value(0)  # led on when power the board
@@ -10,11 +30,79 @@ motor1_in1 = PWM(Pin(12), freq=1000)   # Front Left
 motor2_in3 = PWM(Pin(13), freq=1000)  # Front Right
 motor3_in1 = PWM(Pin(15), freq=1000)   # Back Left
 motor4_in3 = PWM(Pin(14), freq=1000)  # Back Right
+motors = (motor1_in1, motor2_in3, motor3_in1, motor4_in3)  # In MIX_LAYOUT order
+# Duty writes go through the output stage, which skips unchanged values
+outputs = OutputStage(motor.duty for motor in motors)
 
 # Create UDP socket
 udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 udp_socket.bind(('0.0.0.0', 50000))
 
+# Any datagram to STATS_PORT is answered with the stage timings and
+# counters as JSON (drain and control loop modes)
+STATS_PORT = 50001
+stats_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+stats_socket.bind(('0.0.0.0', STATS_PORT))
+
+# Per-stage timings of the packet path, in microseconds
+RECV, PARSE, MIX, DUTY = range(4)
+probes = Probes(('recv', 'parse', 'mix', 'duty'))
+
+# Binary joystick packet, little-endian:
+#   uint16 left_x, left_y, right_x, right_y   (1000-2000)
+#   uint8  seq     (wraps at 256)
+#   uint8  flags
+# Anything that is not exactly PACKET_SIZE bytes is tried as the legacy
+# ASCII format, so existing controllers keep working.
+PACKET_FORMAT = '<4HBB'
+PACKET_SIZE = struct.calcsize(PACKET_FORMAT)  # 10 bytes
+FLAG_STOP = 0x01  # Controller asks for the motors at rest (zero thrust)
+FLAG_ACK = 0x02   # Controller asks for an ack (for round-trip timing)
+NO_SEQ = -1       # Sequence number reported for ASCII packets
+
+# Ack sent back for FLAG_ACK packets: uint8 ACK_TYPE, uint8 seq
+# Off by default: on MicroPython acks need recvfrom (one small allocation
+# per packet) instead of the allocation-free readinto
+ACK_PACKETS = False
+ACK_TYPE = 0xA1
+ack_buf = bytearray((ACK_TYPE, 0))
+
+# Every packet is received into this one buffer
+packet_buf = bytearray(64)
+packet_addr = None  # Sender of the last packet, where it is known
+
+if hasattr(udp_socket, 'recvfrom_into'):
+    def receive_packet():
+        """Receive one datagram into packet_buf; returns its length"""
+        global packet_addr
+        n, packet_addr = udp_socket.recvfrom_into(packet_buf)
+        return n
+elif ACK_PACKETS:
+    def receive_packet():
+        """Receive one datagram into packet_buf; returns its length"""
+        # MicroPython sockets: only recvfrom() tells where to send the ack
+        global packet_addr
+        data, packet_addr = udp_socket.recvfrom(len(packet_buf))
+        packet_buf[:len(data)] = data
+        return len(data)
+else:
+    def receive_packet():
+        """Receive one datagram into packet_buf; returns its length"""
+        # MicroPython sockets: readinto() reads one datagram
+        return udp_socket.readinto(packet_buf)
+
+# Latest-wins draining: each cycle empties the socket queue and applies
+# only the newest packet, so a Wi-Fi burst never replays old stick input
+DRAIN_PACKETS = True
+SEQ_RESYNC = 8  # Stale packets in a row after which the sequence restarts
+last_seq = NO_SEQ
+stale_run = 0
+packet_stats = {
+    'received': 0,
+    'dropped': 0,   # Superseded by a newer packet in the same drain
+    'stale': 0,     # Older than the packet already applied
+}
+
 # Constants for joystick value conversion
 JOYSTICK_MIN = 1000
 JOYSTICK_MAX = 2000
@@ -22,6 +110,35 @@ JOYSTICK_MID = 1500
 PWM_MIN = 0
 PWM_MAX = 1023
 PWM_MID = 511
+# Sticks for FLAG_STOP: thrust at JOYSTICK_MIN (duty 0), the rest centred
+STOP_STICKS = (JOYSTICK_MID, JOYSTICK_MIN, JOYSTICK_MID, JOYSTICK_MID)
+
+# Fixed-rate control loop: packets only update the setpoint, a timer
+# writes the motors CONTROL_HZ times a second. The loop starts with the
+# link down. Without a packet for LINK_TIMEOUT_MS the link is latched as
+# lost and the sticks ramp to STOP_STICKS (zero thrust) within RAMP_MS.
+CONTROL_LOOP = True
+CONTROL_HZ = 200   # 100-400 Hz
+CONTROL_TIMER = -1  # Timer id (-1: virtual timer)
+LINK_TIMEOUT_MS = 250
+RAMP_MS = 500
+PERIOD_US = 1000000 // CONTROL_HZ
+RAMP_STEP = max(1, (JOYSTICK_MAX - JOYSTICK_MIN) * 1000 // (RAMP_MS * CONTROL_HZ))
+REPORT_MS = 10000  # Loop and packet statistics are printed this often
+
+setpoint = list(STOP_STICKS)  # Latest sticks from the radio
+output = list(STOP_STICKS)    # Sticks the motors are driven with
+last_packet_us = 0
+# Latched, so the link state never depends on the sign of a diff against
+# a timestamp old enough for ticks_us to have wrapped
+link_up = False
+last_tick_us = None
+loop_stats = {
+    'ticks': 0,
+    'link_lost': 0,     # Ticks spent ramping without a link
+    'jitter_max_us': 0,
+    'jitter_sum_us': 0,
+}
 
 def setup_wifi_ap():
     """Create WiFi Access Point"""
@@ -49,62 +166,238 @@ def parse_udp_packet(data):
     except:
         return None
 
+def pack_packet(left_x, left_y, right_x, right_y, seq, flags=0):
+    """Encode a binary joystick packet (for controllers and tests)"""
+    return struct.pack(PACKET_FORMAT, left_x, left_y, right_x, right_y, seq & 0xFF, flags)
+
+def parse_packet(buf, n):
+    """Parse the packet in buf[:n] as (left_x, left_y, right_x, right_y, seq, flags)"""
+    if n == PACKET_SIZE:
+        packet = struct.unpack_from(PACKET_FORMAT, buf)
+    else:
+        packet = parse_udp_packet(buf[:n])
+        if not packet:
+            return None
+        packet += (NO_SEQ, 0)
+    # The mixer indexes its tables with the axes: reject anything outside
+    for axis in range(4):
+        if not JOYSTICK_MIN <= packet[axis] <= JOYSTICK_MAX:
+            return None
+    return packet
+
+def ack_packet(packet):
+    """Answer a packet that asks for an ack with its sequence number"""
+    if ACK_PACKETS and packet and packet[5] & FLAG_ACK and packet_addr:
+        ack_buf[1] = packet[4]
+        try:
+            udp_socket.sendto(ack_buf, packet_addr)
+        except OSError:
+            pass  # A full send queue must never stall the control path
+
+def is_newer(seq, last):
+    """Sequence comparison that survives the 8-bit wrap"""
+    return 0 < ((seq - last) & 0xFF) < 128
+
+def drain_packets():
+    """Empty the socket queue and return the newest packet
+
+    Returns the parsed packet, None if the newest datagram was invalid
+    (stop, as in blocking mode), or False if nothing new arrived.
+    """
+    global last_seq, stale_run
+    newest = False
+    while True:
+        t = probes.start()
+        try:
+            n = receive_packet()
+        except OSError:  # EAGAIN: queue is empty
+            break
+        if not n:
+            break
+        t = probes.mark(RECV, t)
+        packet_stats['received'] += 1
+        packet = parse_packet(packet_buf, n)
+        probes.mark(PARSE, t)
+        ack_packet(packet)
+        if packet and packet[4] != NO_SEQ:
+            last = newest[4] if newest else last_seq
+            if last != NO_SEQ and not is_newer(packet[4], last) and stale_run < SEQ_RESYNC:
+                stale_run += 1
+                packet_stats['stale'] += 1
+                continue
+        stale_run = 0
+        if newest is not False:
+            packet_stats['dropped'] += 1
+        newest = packet
+    if newest:
+        last_seq = newest[4]
+    return newest
+
 def map_value(value, in_min, in_max, out_min, out_max):
     """Map value from one range to another"""
     return (value - in_min) * (out_max - out_min) // (in_max - in_min) + out_min
 
+# Lookup tables over the joystick input range (JOYSTICK_MIN..MAX), built
+# once from map_value so the mixer does no multiply or divide per packet
+THRUST_TABLE = array('H', [map_value(v, JOYSTICK_MIN, JOYSTICK_MAX, PWM_MIN, PWM_MAX)
+                           for v in range(JOYSTICK_MIN, JOYSTICK_MAX + 1)])
+ROTATION_TABLE = array('h', [map_value(v, JOYSTICK_MIN, JOYSTICK_MAX, -PWM_MID, PWM_MID)
+                             for v in range(JOYSTICK_MIN, JOYSTICK_MAX + 1)])
+TRIM_TABLE = array('b', [map_value(v, JOYSTICK_MIN, JOYSTICK_MAX, -100, 100)
+                         for v in range(JOYSTICK_MIN, JOYSTICK_MAX + 1)])
+
+# Motor mix (see mixer.LAYOUTS); needs one row per entry in motors
+MIX_LAYOUT = 'quad_x'
+mixer = Mixer(LAYOUTS[MIX_LAYOUT],
+              ((PWM_MIN, PWM_MAX), (-PWM_MID, PWM_MID), (-100, 100), (-100, 100)),
+              PWM_MIN, PWM_MAX)
+if mixer.count != len(motors):
+    raise ValueError('MIX_LAYOUT needs {} motors'.format(mixer.count))
+
 def control_motors(left_x, left_y, right_x, right_y):
     """Control motors based on both joysticks values"""
-    # Map joystick values (1000-2000) to PWM values (0-1023)
-    # For left joystick - main movement control
-    thrust = map_value(left_y, JOYSTICK_MIN, JOYSTICK_MAX, PWM_MIN, PWM_MAX)
-    rotation = map_value(left_x, JOYSTICK_MIN, JOYSTICK_MAX, -PWM_MID, PWM_MID)
-    
-    # For right joystick - fine adjustment/trim
-    trim_x = map_value(right_x, JOYSTICK_MIN, JOYSTICK_MAX, -100, 100)
-    trim_y = map_value(right_y, JOYSTICK_MIN, JOYSTICK_MAX, -100, 100)
-    
-    # Calculate motor speeds
-    fl_speed = thrust - rotation + trim_y - trim_x  # Front Left
-    fr_speed = thrust + rotation + trim_y + trim_x  # Front Right
-    bl_speed = thrust - rotation - trim_y - trim_x  # Back Left
-    br_speed = thrust + rotation - trim_y + trim_x  # Back Right
-    
-    # Constrain values between 0 and 1023
-    fl_speed = max(0, min(1023, fl_speed))
-    fr_speed = max(0, min(1023, fr_speed))
-    bl_speed = max(0, min(1023, bl_speed))
-    br_speed = max(0, min(1023, br_speed))
-    
-    # Apply motor speeds
-    motor1_in1.duty(fl_speed)
-    motor2_in3.duty(fr_speed)
-    motor3_in1.duty(bl_speed)
-    motor4_in3.duty(br_speed)
+    # Map joystick values (1000-2000) to PWM units: the left joystick is
+    # the main movement control, the right one fine adjustment/trim
+    t = probes.start()
+    speeds = mixer.mix(THRUST_TABLE[left_y - JOYSTICK_MIN],
+                       ROTATION_TABLE[left_x - JOYSTICK_MIN],
+                       TRIM_TABLE[right_y - JOYSTICK_MIN],
+                       TRIM_TABLE[right_x - JOYSTICK_MIN])
+
+    t = probes.mark(MIX, t)
+
+    # Apply motor speeds (only the ones that changed)
+    outputs.set_all(speeds)
+    probes.mark(DUTY, t)
+
+def apply_packet(packet):
+    """Drive the motors from a parsed packet"""
+    if not packet:
+        # Invalid packet - centre the sticks
+        control_motors(JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID)
+    elif packet[5] & FLAG_STOP:
+        control_motors(*STOP_STICKS)
+    else:
+        control_motors(packet[0], packet[1], packet[2], packet[3])
+
+def set_setpoint(packet):
+    """Take a packet as the setpoint for the next control ticks"""
+    global last_packet_us, link_up
+    if not packet:
+        for axis in range(4):
+            setpoint[axis] = JOYSTICK_MID
+    else:
+        source = STOP_STICKS if packet[5] & FLAG_STOP else packet
+        for axis in range(4):
+            setpoint[axis] = source[axis]
+    last_packet_us = time.ticks_us()
+    link_up = True
+
+def control_tick(timer=None):
+    """One control loop step: follow the setpoint or ramp on link loss"""
+    global last_tick_us, link_up
+    now = time.ticks_us()
+    if last_tick_us is not None:
+        jitter = abs(time.ticks_diff(now, last_tick_us) - PERIOD_US)
+        loop_stats['jitter_sum_us'] += jitter
+        if jitter > loop_stats['jitter_max_us']:
+            loop_stats['jitter_max_us'] = jitter
+    last_tick_us = now
+    loop_stats['ticks'] += 1
+
+    if link_up and time.ticks_diff(now, last_packet_us) >= LINK_TIMEOUT_MS * 1000:
+        link_up = False  # Only a new packet brings the link back
+    if link_up:
+        for axis in range(4):
+            output[axis] = setpoint[axis]
+    else:
+        loop_stats['link_lost'] += 1
+        for axis in range(4):
+            value = output[axis]
+            rest = STOP_STICKS[axis]
+            if value > rest:
+                output[axis] = max(rest, value - RAMP_STEP)
+            elif value < rest:
+                output[axis] = min(rest, value + RAMP_STEP)
+    control_motors(output[0], output[1], output[2], output[3])
+
+def start_control_loop():
+    """Run control_tick from a periodic timer; returns the timer"""
+    timer = Timer(CONTROL_TIMER)
+    timer.init(mode=Timer.PERIODIC, freq=CONTROL_HZ, callback=control_tick)
+    return timer
+
+def loop_report():
+    """One-line summary of the control loop and packet counters"""
+    ticks = max(1, loop_stats['ticks'] - 1)
+    return 'loop {} Hz: {} ticks, jitter avg {} us max {} us, link lost {} | packets {} | duty {}'.format(
+        CONTROL_HZ, loop_stats['ticks'], loop_stats['jitter_sum_us'] // ticks,
+        loop_stats['jitter_max_us'], loop_stats['link_lost'], packet_stats, outputs.stats())
+
+def stats_report():
+    """Stage timings and counters as JSON"""
+    return json.dumps({
+        'stages': probes.summary(),
+        'packets': packet_stats,
+        'loop': loop_stats,
+        'duty': outputs.stats(),
+    })
+
+def answer_stats_query():
+    """Reply to one query datagram on STATS_PORT"""
+    try:
+        data, addr = stats_socket.recvfrom(16)
+    except OSError:
+        return
+    try:
+        stats_socket.sendto(stats_report().encode(), addr)
+    except OSError:
+        pass  # A failed telemetry reply must never reach the motors
 
 def main():
     # Setup WiFi access point
     setup_wifi_ap()
     print("Waiting for UDP commands on port 50000...")
-    
+
+    if CONTROL_LOOP:
+        # The timer drives the motors; packets only move the setpoint
+        start_control_loop()
+        take_packet = set_setpoint
+    else:
+        take_packet = apply_packet
+    if DRAIN_PACKETS or CONTROL_LOOP:
+        udp_socket.setblocking(False)
+        poller = select.poll()
+        poller.register(udp_socket, select.POLLIN)
+        stats_socket.setblocking(False)
+        poller.register(stats_socket, select.POLLIN)
+        # MicroPython's poll reports the socket itself, CPython's its fd
+        stats_fd = stats_socket.fileno() if hasattr(stats_socket, 'fileno') else None
+    last_report = time.ticks_ms()
+
     while True:
         try:
-            # Receive UDP data
-            data, addr = udp_socket.recvfrom(64)
-            
-            # Parse joystick values
-            joystick_values = parse_udp_packet(data)
-            
-            if joystick_values:
-                left_x, left_y, right_x, right_y = joystick_values
-                control_motors(left_x, left_y, right_x, right_y)
+            if DRAIN_PACKETS or CONTROL_LOOP:
+                # Sleep until something arrives, then keep only the newest
+                for ready, event in poller.poll(REPORT_MS):
+                    if ready is stats_socket or ready == stats_fd:
+                        answer_stats_query()
+                packet = drain_packets()
+                if packet is not False:
+                    take_packet(packet)
+                if time.ticks_diff(time.ticks_ms(), last_report) >= REPORT_MS:
+                    last_report = time.ticks_ms()
+                    print(loop_report())
             else:
-                # Invalid packet - stop motors
-                control_motors(JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID)
-                
+                # Receive UDP data and parse joystick values
+                packet = parse_packet(packet_buf, receive_packet())
+                ack_packet(packet)
+                apply_packet(packet)
+
         except Exception as e:
             print("Error:", e)
             # If there's an error, stop motors
+            set_setpoint(None)
             control_motors(JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID)
 
 if __name__ == "__main__":
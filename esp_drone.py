@@ -2,9 +2,33 @@ import network
 
 from machine import Pin, PWM
 
-import socket
+from device_state import DeviceState
 
-import json
+from response_cache import CachedResponse, NO_CACHE, IMMUTABLE
+
+from router import Router
+
+from sse import EventSource
+
+from template import Template
+
+import webserver
+
+try:
+
+    import uasyncio as asyncio
+
+except ImportError:
+
+    import asyncio
+
+try:
+
+    from uarray import array
+
+except ImportError:
+
+    from array import array
 
 
 
@@ -18,6 +42,10 @@ motor3_in1 = PWM(Pin(4), freq=1000)
 
 motor4_in3 = PWM(Pin(12), freq=1000)  
 
+# Motor n is motors[n - 1]; its speed is motor_speeds[n - 1]
+
+motors = (motor1_in1, motor2_in3, motor3_in1, motor4_in3)
+
 
 
 # Onboard LED setup
@@ -28,17 +56,7 @@ led.value(0)
 
 
 
-motor_speeds = {
-
-    "motor1": 100,
-
-    "motor2": 100,
-
-    "motor3": 100,
-
-    "motor4": 100
-
-}
+motor_speeds = array('H', [100] * len(motors))
 
 motors_state = "off"
 
@@ -64,13 +82,9 @@ def motors_on():
 
     global motors_state
 
-    motor1_in1.duty(motor_speeds["motor1"])
-
-    motor2_in3.duty(motor_speeds["motor2"])
-
-    motor3_in1.duty(motor_speeds["motor3"])
+    for i in range(len(motors)):
 
-    motor4_in3.duty(motor_speeds["motor4"])
+        motors[i].duty(motor_speeds[i])
 
     motors_state = "on"
 
@@ -80,13 +94,9 @@ def motors_off():
 
     global motors_state
 
-    motor1_in1.duty(0)
+    for motor in motors:
 
-    motor2_in3.duty(0)
-
-    motor3_in1.duty(0)
-
-    motor4_in3.duty(0)
+        motor.duty(0)
 
     motors_state = "off"
 
@@ -94,63 +104,74 @@ def motors_off():
 
 def adjust_motor_speed(motor_num, new_speed):
 
-    global motor_speeds
+    if not 1 <= motor_num <= len(motors):
+
+        return False
 
-    try:
+    new_speed = max(0, min(1023, int(new_speed)))
 
-        new_speed = max(0, min(1023, int(new_speed)))
+    motor_speeds[motor_num - 1] = new_speed
 
-        motor_speeds[f"motor{motor_num}"] = new_speed
+    if motors_state == "on":
 
-        if motors_state == "on":
+        motors[motor_num - 1].duty(new_speed)
 
-            if motor_num == 1: motor1_in1.duty(new_speed)
+    return True
 
-            elif motor_num == 2: motor2_in3.duty(new_speed)
 
-            elif motor_num == 3: motor3_in1.duty(new_speed)
 
-            elif motor_num == 4: motor4_in3.duty(new_speed)
+def set_speeds(speeds):
 
-        return True
+    """Set every motor from a sequence of speeds, in motor order"""
 
-    except:
+    running = motors_state == "on"
 
-        return False
+    for i in range(len(motors)):
+
+        speed = max(0, min(1023, speeds[i]))
+
+        motor_speeds[i] = speed
+
+        if running:
+
+            motors[i].duty(speed)
 
 
 
 def adjust_all_speeds(increment):
 
-    for i in range(1, 5):
+    set_speeds([speed + increment for speed in motor_speeds])
 
-        current_speed = motor_speeds[f"motor{i}"]
 
-        new_speed = max(0, min(1023, current_speed + increment))
 
-        adjust_motor_speed(i, new_speed)
+def parse_speeds(query):
 
+    """Speeds from a query like 'm=200,210,190,205', or None if malformed"""
 
+    for param in query.split('&'):
 
-def web_page():
+        if param[:2] == 'm=':
 
-    html = f"""
+            try:
 
-    <html>
+                speeds = [int(v) for v in param[2:].split(',')]
 
-    <head>
+            except ValueError:
 
-        <meta name="viewport" content="width=device-width, initial-scale=1">
+                return None
 
-        <title>Motor Control</title>
+            return speeds if len(speeds) == len(motors) else None
 
-        <style>
+    return None
 
-            body {{ font-family: Arial, sans-serif; text-align: center; }}
 
-            button {{ padding: 10px; margin: 5px; width: 150px; }}
 
-            .motor-control {{ 
+CSS = """
+            body { font-family: Arial, sans-serif; text-align: center; }
+
+            button { padding: 10px; margin: 5px; width: 150px; }
+
+            .motor-control { 
 
                 border: 1px solid #ccc; 
 
@@ -160,9 +181,9 @@ def web_page():
 
                 border-radius: 5px;
 
-            }}
+            }
 
-            .speed-input {{
+            .speed-input {
 
                 width: 80px;
 
@@ -174,17 +195,17 @@ def web_page():
 
                 text-align: center;
 
-            }}
+            }
 
-            .speed-label {{
+            .speed-label {
 
                 font-weight: bold;
 
                 margin-right: 10px;
 
-            }}
+            }
 
-            .set-button {{
+            .set-button {
 
                 padding: 5px 15px;
 
@@ -200,63 +221,78 @@ def web_page():
 
                 cursor: pointer;
 
-            }}
+            }
 
-        </style>
+"""
 
-        <script>
 
-            function updateStatus() {{
 
-                fetch('/status')
+JS = """
+            // Status is pushed over /events when it changes; browsers
+
+            // without EventSource fall back to polling /status
+
+            const polling = !window.EventSource;
 
-                .then(response => response.json())
 
-                .then(data => {{
 
-                    document.getElementById('motorsState').innerText = data.motors_state;
+            function showStatus(data) {
 
-                    document.getElementById('ledStatus').innerText = data.led_status;
+                document.getElementById('motorsState').innerText = data.motors_state;
 
-                    
+                document.getElementById('ledStatus').innerText = data.led_status;
 
-                    // Only update displayed speeds, not input values
+                
+
+                // Only update displayed speeds, not input values
+
+                for (let i = 1; i <= 4; i++) {
+
+                    document.getElementById(`motor${i}Speed`).innerText = data[`motor${i}_speed`];
 
-                    for (let i = 1; i <= 4; i++) {{
+                }
 
-                        document.getElementById(`motor${{i}}Speed`).innerText = data[`motor${{i}}_speed`];
+            }
 
-                    }}
 
-                }});
 
-            }}
+            function updateStatus() {
+
+                if (!polling) return;
+
+                fetch('/status')
+
+                .then(response => response.json())
+
+                .then(showStatus);
+
+            }
 
             
 
-            function controlMotors(action) {{
+            function controlMotors(action) {
 
                 fetch('/motors/' + action)
 
                 .then(() => updateStatus());
 
-            }}
+            }
 
 
 
-            function controlLED(action) {{
+            function controlLED(action) {
 
                 fetch('/led/' + action)
 
                 .then(() => updateStatus());
 
-            }}
+            }
 
 
 
-            function setSpeed(motorNum) {{
+            function setSpeed(motorNum) {
 
-                const input = document.getElementById(`speed${{motorNum}}`);
+                const input = document.getElementById(`speed${motorNum}`);
 
                 let speed = parseInt(input.value) || 0;
 
@@ -270,35 +306,83 @@ def web_page():
 
                 
 
-                fetch(`/adjust/${{motorNum}}/${{speed}}`)
+                fetch(`/adjust/${motorNum}/${speed}`)
 
                 .then(response => updateStatus());
 
-            }}
+            }
+
+
 
+            function setAllSpeeds() {
 
+                const speeds = [];
 
-            function adjustAllSpeeds(increment) {{
+                for (let i = 1; i <= 4; i++) {
 
-                fetch(`/adjust_all/${{increment}}`)
+                    const input = document.getElementById(`speed${i}`);
+
+                    input.value = Math.max(0, Math.min(1023, parseInt(input.value) || 0));
+
+                    speeds.push(input.value);
+
+                }
+
+                fetch('/set?m=' + speeds.join(','))
+
+                .then(response => updateStatus());
+
+            }
+
+
+
+            function adjustAllSpeeds(increment) {
+
+                fetch(`/adjust_all/${increment}`)
 
                 .then(() => updateStatus());
 
-            }}
+            }
 
 
 
             // Initialize updates
 
-            document.addEventListener('DOMContentLoaded', function() {{
+            document.addEventListener('DOMContentLoaded', function() {
+
+                if (polling) {
+
+                    updateStatus();
+
+                    setInterval(updateStatus, 500);
+
+                } else {
+
+                    const events = new EventSource('/events');
+
+                    events.onmessage = (event) => showStatus(JSON.parse(event.data));
+
+                }
+
+            });
+
+"""
+
+
+
+HTML = """
+
+    <html>
+
+    <head>
 
-                updateStatus();
+        <meta name="viewport" content="width=device-width, initial-scale=1">
 
-                setInterval(updateStatus, 500);
+        <title>Motor Control</title>
 
-            }});
+        <link rel="stylesheet" href="/app.css?v={{style}}">
 
-        </script>
+        <script src="/app.js?v={{script}}"></script>
 
     </head>
 
@@ -310,7 +394,7 @@ def web_page():
 
         <div class="motor-control">
 
-            <p>LED Status: <span id="ledStatus">{led_state}</span></p>
+            <p>LED Status: <span id="ledStatus">{{led_state}}</span></p>
 
             <button onclick="controlLED('on')">LED ON</button>
 
@@ -322,7 +406,7 @@ def web_page():
 
         <div class="motor-control">
 
-            <p>Motors State: <span id="motorsState">{motors_state}</span></p>
+            <p>Motors State: <span id="motorsState">{{motors_state}}</span></p>
 
             <button onclick="controlMotors('on')">All Motors ON</button>
 
@@ -350,7 +434,7 @@ def web_page():
 
                 <button class="set-button" onclick="setSpeed(1)">Set</button>
 
-                <span>Current: <span id="motor1Speed">{motor_speeds['motor1']}</span></span>
+                <span>Current: <span id="motor1Speed">{{motor1}}</span></span>
 
             </div>
 
@@ -364,7 +448,7 @@ def web_page():
 
                 <button class="set-button" onclick="setSpeed(2)">Set</button>
 
-                <span>Current: <span id="motor2Speed">{motor_speeds['motor2']}</span></span>
+                <span>Current: <span id="motor2Speed">{{motor2}}</span></span>
 
             </div>
 
@@ -378,7 +462,7 @@ def web_page():
 
                 <button class="set-button" onclick="setSpeed(3)">Set</button>
 
-                <span>Current: <span id="motor3Speed">{motor_speeds['motor3']}</span></span>
+                <span>Current: <span id="motor3Speed">{{motor3}}</span></span>
 
             </div>
 
@@ -392,10 +476,14 @@ def web_page():
 
                 <button class="set-button" onclick="setSpeed(4)">Set</button>
 
-                <span>Current: <span id="motor4Speed">{motor_speeds['motor4']}</span></span>
+                <span>Current: <span id="motor4Speed">{{motor4}}</span></span>
 
             </div>
 
+            <br>
+
+            <button onclick="setAllSpeeds()">Set All</button>
+
         </div>
 
     </body>
@@ -404,113 +492,147 @@ def web_page():
 
     """
 
-    return html
+
+
+# Styles and script are separate versioned assets that the browser keeps;
+
+# the page itself is revalidated through its state-versioned ETag
+
+STYLE = CachedResponse(CSS, 'text/css', keep_alive=True, cache_control=IMMUTABLE)
+
+SCRIPT = CachedResponse(JS, 'application/javascript', keep_alive=True, cache_control=IMMUTABLE)
+
+PAGE = Template(HTML.replace('{{style}}', STYLE.hash).replace('{{script}}', SCRIPT.hash),
+
+                cache_control=NO_CACHE)
 
 
 
-def get_status_json():
+async def web_page(req):
 
-    return json.dumps({
+    # Stream the compiled page chunk by chunk with the live values filled in;
+
+    # the status version doubles as the state version in the ETag
+
+    values = {"motor%d" % (i + 1): motor_speeds[i] for i in range(len(motors))}
+
+    values["led_state"] = led_state
+
+    values["motors_state"] = motors_state
+
+    await PAGE.render(req, values, status.version)
+
+
+
+def status_values():
+
+    return {
 
         "motors_state": motors_state,
 
         "led_status": led_state,
 
-        "motor1_speed": motor_speeds["motor1"],
+        "motor1_speed": motor_speeds[0],
 
-        "motor2_speed": motor_speeds["motor2"],
+        "motor2_speed": motor_speeds[1],
 
-        "motor3_speed": motor_speeds["motor3"],
+        "motor3_speed": motor_speeds[2],
 
-        "motor4_speed": motor_speeds["motor4"]
+        "motor4_speed": motor_speeds[3]
 
-    })
+    }
 
 
 
-def web_server():
+def set_led(state):
 
     global led_state
 
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
+    led.value(0 if state == 'on' else 1)  # Active-low LED
+
+    led_state = state
+
+
+
+# Web server routes: commands answer with the refreshed page
 
-    s = socket.socket()
+def page_command(action):
 
-    s.bind(addr)
+    def handler(*params):
 
-    s.listen(5)
+        action(*params)
 
+        status.changed()
 
+        return web_page
 
-    while True:
+    return handler
 
-        cl, addr = s.accept()
 
-        try:
 
-            request = str(cl.recv(1024))
+BAD_SPEEDS = webserver.response(b'Expected m=<speed>,<speed>,<speed>,<speed>', 'text/plain', '400 Bad Request')
 
 
 
-            if '/motors/on' in request:
+async def set_command(req):
 
-                motors_on()
+    # /set?m=200,210,190,205: all motors in one request, answered with the status
 
-            elif '/motors/off' in request:
+    speeds = parse_speeds(req.query)
 
-                motors_off()
+    if speeds is None:
 
-            elif '/adjust/' in request:
+        req.writer.write(BAD_SPEEDS)
 
-                parts = request.split('/adjust/')[1].split('/')
+        return
 
-                motor_num = int(parts[0])
+    set_speeds(speeds)
 
-                speed = int(parts[1].split(' ')[0])
+    status.changed()
 
-                adjust_motor_speed(motor_num, speed)
+    req.writer.write(status.response())
 
-            elif '/adjust_all/' in request:
 
-                increment = int(request.split('/adjust_all/')[1].split(' ')[0])
 
-                adjust_all_speeds(increment)
+# Status JSON serialised once per change; pages with an open /events
 
-            elif '/led/on' in request:
+# stream get it pushed on every change
 
-                led.value(0)
+status = DeviceState(status_values)
 
-                led_state = 'on'
+events = EventSource(status.json)
 
-            elif '/led/off' in request:
+status.on_change = events.notify
 
-                led.value(1)
 
-                led_state = 'off'
 
+routes = Router()
 
+routes.add('/', lambda: web_page)
 
-            if '/status' in request:
+routes.add('/app.css', lambda: STYLE)
 
-                cl.send('HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n')
+routes.add('/app.js', lambda: SCRIPT)
 
-                cl.sendall(get_status_json())
+routes.add('/events', lambda: events.stream)
 
-            else:
+routes.add('/status', status.response)
 
-                cl.send('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n')
+routes.add('/probes', webserver.probe_report)  # Stage timings (JSON)
 
-                cl.sendall(web_page())
+routes.add('/motors/on', page_command(motors_on))
 
+routes.add('/motors/off', page_command(motors_off))
 
+routes.add('/adjust/<motor>/<speed>', page_command(lambda motor, speed: adjust_motor_speed(int(motor), int(speed))))
 
-        except Exception as e:
+routes.add('/set', lambda: set_command)
 
-            print('Error:', e)
+routes.add('/adjust_all/<increment>', page_command(lambda increment: adjust_all_speeds(int(increment))))
 
-        finally:
+routes.add('/led/on', page_command(lambda: set_led('on')))
 
-            cl.close()
+routes.add('/led/off', page_command(lambda: set_led('off')))
 
 
 
@@ -518,7 +640,7 @@ def setup():
 
     create_wifi()
 
-    web_server()
+    asyncio.run(webserver.serve(webserver.routed(routes)))
 
 
 
@@ -0,0 +1,228 @@
+# Ground station for drone_udp.py (runs on the host, not the board)
+# Sends joystick packets at a fixed rate from a gamepad or a scripted
+# input and reports send jitter once a second. With --ack it also asks the
+# drone to ack them and reports round-trip time and loss; the drone only
+# answers with ACK_PACKETS = True in drone_udp.py.
+#
+#   python ground_station.py                      # 50 Hz sweep to 192.168.4.1
+#   python ground_station.py --rate 100 --input gamepad --ack
+#   python ground_station.py --simulate --ack     # drone_udp.py on loopback
+#
+# --simulate runs drone_udp.py in this process against the fake hardware
+# backend (hal) and sends to it over 127.0.0.1, with acks enabled.
+import argparse
+import asyncio
+import math
+import os
+import struct
+import sys
+import threading
+import time
+
+DRONE_IP = '192.168.4.1'  # Default address of the drone's access point
+DRONE_PORT = 50000
+
+# Must match drone_udp.py
+PACKET_FORMAT = '<4HBB'
+FLAG_ACK = 0x02
+ACK_TYPE = 0xA1
+JOYSTICK_MIN = 1000
+JOYSTICK_MAX = 2000
+JOYSTICK_MID = 1500
+
+ACK_TIMEOUT = 0.5  # Seconds after which an unanswered packet counts as lost
+SPIN = 0.001  # The last part of each wait is spun, not slept: the event
+              # loop's timers are only good to about a millisecond
+
+
+# Input sources: callables returning (left_x, left_y, right_x, right_y)
+
+def hover_input():
+    return lambda t: (JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID, JOYSTICK_MID)
+
+
+def sweep_input(period=4.0):
+    """Sticks moving smoothly through their whole range"""
+    span = (JOYSTICK_MAX - JOYSTICK_MIN) // 2
+
+    def read(t):
+        phase = 2 * math.pi * t / period
+        return (JOYSTICK_MID + int(span * math.sin(phase)),
+                JOYSTICK_MID + int(span * math.sin(phase / 2)),
+                JOYSTICK_MID + int(span * math.cos(phase) / 4),
+                JOYSTICK_MID + int(span * math.sin(phase * 2) / 4))
+    return read
+
+
+def gamepad_input(axes=(0, 1, 3, 4)):
+    """First gamepad through pygame; axes are left_x, left_y, right_x, right_y"""
+    try:
+        import pygame
+    except ImportError:
+        sys.exit('--input gamepad needs pygame: pip install pygame')
+    pygame.init()
+    pygame.joystick.init()
+    if not pygame.joystick.get_count():
+        sys.exit('no gamepad found')
+    pad = pygame.joystick.Joystick(0)
+    pad.init()
+    span = (JOYSTICK_MAX - JOYSTICK_MIN) // 2
+
+    def read(t):
+        pygame.event.pump()
+        values = []
+        for i, axis in enumerate(axes):
+            value = pad.get_axis(axis)
+            if i % 2:
+                value = -value  # Stick up is negative on most pads
+            values.append(JOYSTICK_MID + int(span * value))
+        return tuple(max(JOYSTICK_MIN, min(JOYSTICK_MAX, v)) for v in values)
+    return read
+
+
+INPUTS = {'hover': hover_input, 'sweep': sweep_input, 'gamepad': gamepad_input}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Link(asyncio.DatagramProtocol):
+    """Sent-time bookkeeping per sequence number and ack matching"""
+
+    def __init__(self):
+        self.sent = [None] * 256  # Send time of each outstanding sequence number
+        self.rtts = []
+        self.acked = 0
+        self.lost = 0
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) != 2 or data[0] != ACK_TYPE:
+            return
+        sent = self.sent[data[1]]
+        if sent is not None:
+            self.rtts.append(time.perf_counter() - sent)
+            self.sent[data[1]] = None
+            self.acked += 1
+
+    def expire(self, now):
+        """Count packets unanswered for ACK_TIMEOUT as lost"""
+        for seq, sent in enumerate(self.sent):
+            if sent is not None and now - sent > ACK_TIMEOUT:
+                self.sent[seq] = None
+                self.lost += 1
+
+    def error_received(self, exc):
+        pass  # ICMP port unreachable while the drone is not up yet
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    link = Link()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: link, remote_addr=(args.host, args.port))
+    read_input = INPUTS[args.input]()
+    period = 1.0 / args.rate
+    flags = FLAG_ACK if args.ack else 0
+
+    seq = 0
+    sent = 0
+    lateness = []  # How late each send was against its slot, seconds
+    start = time.perf_counter()
+    next_report = start + 1.0
+    stop = start + args.duration if args.duration else None
+    try:
+        while stop is None or time.perf_counter() < stop:
+            # Absolute deadlines: a late send never shifts the later ones
+            deadline = start + sent * period
+            delay = deadline - time.perf_counter()
+            if delay > SPIN:
+                await asyncio.sleep(delay - SPIN)
+            now = time.perf_counter()
+            while now < deadline:
+                now = time.perf_counter()
+            lateness.append(now - deadline)
+
+            sticks = read_input(now - start)
+            if args.ascii:
+                packet = '{:04d}{:04d}{:04d}{:04d}'.format(*sticks).encode()
+            else:
+                packet = struct.pack(PACKET_FORMAT, *sticks, seq, flags)
+                if flags:
+                    if link.sent[seq] is not None:
+                        link.lost += 1  # Never answered within 256 packets
+                    link.sent[seq] = now
+            transport.sendto(packet)
+            seq = (seq + 1) & 0xFF
+            sent += 1
+
+            if now >= next_report:
+                link.expire(now)
+                report(sent, link, lateness, args)
+                link.rtts = []
+                lateness = []
+                next_report += 1.0
+    finally:
+        transport.close()
+
+
+def report(sent, link, lateness, args):
+    line = 'sent {:6d}  jitter p50 {:6.3f} p99 {:6.3f} max {:6.3f} ms'.format(
+        sent, percentile(lateness, 0.5) * 1000, percentile(lateness, 0.99) * 1000,
+        max(lateness or [0]) * 1000)
+    if args.ack and not args.ascii:
+        answered = link.acked + link.lost
+        loss = 100.0 * link.lost / answered if answered else 0.0
+        line += '  |  rtt p50 {:6.2f} p99 {:6.2f} ms  loss {:5.1f}%'.format(
+            percentile(link.rtts, 0.5) * 1000, percentile(link.rtts, 0.99) * 1000, loss)
+    print(line)
+
+
+def simulate_drone():
+    """Run drone_udp.py on the fake hardware in a background thread"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, root)
+    import hal
+    board = hal.install()
+    path = os.path.join(root, 'drone_udp.py')
+    namespace = {'__name__': '__simulated__', '__file__': path, 'bytearray': board.bytearray}
+    with open(path) as f:
+        exec(compile(f.read(), path, 'exec'), namespace)
+    namespace['ACK_PACKETS'] = True  # The host socket has recvfrom_into anyway
+    threading.Thread(target=namespace['main'], daemon=True).start()
+    return namespace
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fixed-rate UDP ground station for drone_udp.py')
+    parser.add_argument('--host', default=DRONE_IP)
+    parser.add_argument('--port', type=int, default=DRONE_PORT)
+    parser.add_argument('--rate', type=float, default=50.0, help='packets per second')
+    parser.add_argument('--input', choices=sorted(INPUTS), default='sweep')
+    parser.add_argument('--duration', type=float, help='seconds (default: until Ctrl-C)')
+    parser.add_argument('--ack', action='store_true',
+                        help='ask the drone for acks, for RTT and loss (needs ACK_PACKETS)')
+    parser.add_argument('--ascii', action='store_true', help='legacy 16-digit packets')
+    parser.add_argument('--simulate', action='store_true',
+                        help='run drone_udp.py locally on the fake hardware')
+    args = parser.parse_args()
+
+    if args.simulate:
+        simulate_drone()
+        args.host = '127.0.0.1'
+        time.sleep(0.2)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# Hardware abstraction for running the device scripts off the board
+# The scripts import machine, network and utime directly, as MicroPython
+# expects. install() puts a backend's versions of those modules into
+# sys.modules first, so the unchanged scripts run on the host against it.
+#
+#   import hal
+#   board = hal.install()          # fake backend (the only one so far)
+#   ... exec / import a device script ...
+#   board.writes('duty')           # every PWM duty write, timestamped
+#
+# Host-only: this package is not uploaded to the board.
+#
+# install() also gives the shared device modules (LIBRARIES) the backend's
+# bytearray, which lacks the methods MicroPython's lacks; scripts exec'd
+# by the host tools get it through their namespace (board.bytearray).
+import importlib
+import sys
+
+MODULES = ('machine', 'network', 'utime')
+LIBRARIES = ('request_buffer', 'response_cache', 'template', 'router', 'webserver',
+             'websocket', 'sse', 'device_state', 'output_stage', 'mixer', 'probes')
+
+
+def install(backend='fake', **options):
+    """Register the backend's modules and return its Board"""
+    if backend == 'fake':
+        from hal import fake
+        board = fake.Board(**options)
+    else:
+        raise ValueError('unknown hal backend: {}'.format(backend))
+    for name, module in board.modules().items():
+        sys.modules[name] = module
+    for name in LIBRARIES:
+        importlib.import_module(name).bytearray = board.bytearray
+    return board
+
+
+def uninstall():
+    """Drop the installed modules so the next import sees a fresh board"""
+    for name in MODULES:
+        sys.modules.pop(name, None)
@@ -0,0 +1,265 @@
+# Fake hardware backend
+# Pins, PWM channels and timers that only record what the code asks of
+# them. Every write is logged with a timestamp from a virtual microsecond
+# clock, and the clock moves on by the modelled cost of that register
+# write, so a control path can be profiled and regression-tested at host
+# speed and with repeatable timings. utime's ticks/sleep functions read
+# and advance the same clock; timers fire as it passes their deadline.
+import builtins
+import types
+
+# Modelled cost of one call in microseconds. Rough figures for MicroPython
+# on an ESP8266, interpreter overhead included: the software PWM rebuilds
+# its timing table on every duty or frequency change.
+COSTS_US = {
+    'value': 5,
+    'duty': 20,
+    'duty_u16': 20,
+    'freq': 60,
+    'deinit': 20,
+}
+
+# bytearray methods that MicroPython's bytearray does not have; CPython's
+# would let code pass on the host that fails on the board
+MISSING_BYTEARRAY = ('find', 'rfind', 'index', 'rindex', 'count', 'split', 'rsplit',
+                     'strip', 'lstrip', 'rstrip', 'replace', 'startswith', 'endswith',
+                     'lower', 'upper', 'partition', 'join')
+
+
+class DeviceBytearray(builtins.bytearray):
+    """bytearray limited to what MicroPython's offers"""
+
+    def __getattribute__(self, name):
+        if name in MISSING_BYTEARRAY:
+            raise AttributeError("'bytearray' object has no attribute '{}'".format(name))
+        return builtins.bytearray.__getattribute__(self, name)
+
+
+TICKS_PERIOD = 1 << 30  # utime ticks wrap like the board's
+_TICKS_HALF = TICKS_PERIOD // 2
+
+
+class Board:
+    """Fake machine/network/utime modules sharing one clock and write log"""
+
+    bytearray = DeviceBytearray  # For the device code run against this board
+
+    def __init__(self, costs=None):
+        self.costs = dict(COSTS_US)
+        self.costs.update(costs or {})
+        self.now_us = 0
+        self.busy_us = 0   # Total modelled time spent writing registers
+        self.log = []      # (time_us, target, kind, value) per write
+        self.timers = []   # Armed Timer objects
+
+    # Recording
+
+    def write(self, target, kind, value):
+        self.log.append((self.now_us, target, kind, value))
+        cost = self.costs.get(kind, 0)
+        self.busy_us += cost
+        self.now_us += cost
+
+    def writes(self, kind=None, target=None):
+        """Logged writes, optionally only of one kind and/or one pin"""
+        return [w for w in self.log
+                if (kind is None or w[2] == kind) and (target is None or w[1] == target)]
+
+    def last(self, target, kind):
+        """Most recent value written, or None"""
+        for w in reversed(self.log):
+            if w[1] == target and w[2] == kind:
+                return w[3]
+        return None
+
+    def clear(self):
+        self.log = []
+        self.busy_us = 0
+
+    def cost_of(self, func, *args):
+        """Call func and return (writes issued, modelled microseconds)"""
+        count, busy = len(self.log), self.busy_us
+        func(*args)
+        return len(self.log) - count, self.busy_us - busy
+
+    # Virtual clock
+
+    def advance(self, us):
+        """Move the clock on, firing every timer that falls due on the way"""
+        end = self.now_us + us
+        while True:
+            due = [t for t in self.timers if t.deadline <= end]
+            if not due:
+                break
+            timer = min(due, key=lambda t: t.deadline)
+            self.now_us = max(self.now_us, timer.deadline)
+            timer.fire()
+        self.now_us = max(self.now_us, end)
+
+    def ticks_us(self):
+        return self.now_us % TICKS_PERIOD
+
+    # Modules
+
+    def modules(self):
+        board = self
+        machine = types.ModuleType('machine')
+        machine.Pin = type('Pin', (Pin,), {'board': board})
+        machine.PWM = type('PWM', (PWM,), {'board': board})
+        machine.Timer = type('Timer', (Timer,), {'board': board})
+        machine.freq = lambda *args: 80000000
+        machine.unique_id = lambda: b'\xfa\x4e\x00\x00\x00\x01'
+
+        network = types.ModuleType('network')
+        network.STA_IF = 0
+        network.AP_IF = 1
+        network.WLAN = WLAN
+
+        utime = types.ModuleType('utime')
+        utime.ticks_us = board.ticks_us
+        utime.ticks_ms = lambda: board.now_us // 1000 % TICKS_PERIOD
+        utime.ticks_add = lambda ticks, delta: (ticks + delta) % TICKS_PERIOD
+        utime.ticks_diff = ticks_diff
+        utime.sleep_us = board.advance
+        utime.sleep_ms = lambda ms: board.advance(ms * 1000)
+        utime.sleep = lambda s: board.advance(int(s * 1000000))
+        utime.time = lambda: board.now_us // 1000000
+        return {'machine': machine, 'network': network, 'utime': utime}
+
+
+def ticks_diff(end, start):
+    """Signed difference of two wrapped tick values, as on the board"""
+    return (end - start + _TICKS_HALF) % TICKS_PERIOD - _TICKS_HALF
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 1
+    IRQ_RISING = 2
+    board = None
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 0
+        if value is not None:
+            self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+        self.board.write(self.id, 'value', self._value)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=0):
+        self.handler = handler
+
+
+class PWM:
+    board = None
+
+    def __init__(self, pin, freq=None, duty=None, duty_u16=None):
+        self.pin = pin
+        self.id = pin.id
+        self._freq = 0
+        self._duty_u16 = 0
+        if freq is not None:
+            self.freq(freq)
+        if duty is not None:
+            self.duty(duty)
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+        self.board.write(self.id, 'freq', value)
+
+    def duty(self, value=None):
+        # 10-bit duty as on the ESP8266/ESP32 ports
+        if value is None:
+            return self._duty_u16 >> 6
+        value = max(0, min(1023, value))
+        self._duty_u16 = value << 6
+        self.board.write(self.id, 'duty', value)
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty_u16
+        self._duty_u16 = max(0, min(65535, value))
+        self.board.write(self.id, 'duty_u16', self._duty_u16)
+
+    def deinit(self):
+        self._duty_u16 = 0
+        self.board.write(self.id, 'deinit', 0)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+    board = None
+
+    def __init__(self, id=-1, **kwargs):
+        self.id = id
+        self.callback = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.mode = mode
+        self.period_us = max(1, int(1000000 / freq) if freq > 0 else period * 1000)
+        self.callback = callback
+        self.deadline = self.board.now_us + self.period_us
+        if self not in self.board.timers:
+            self.board.timers.append(self)
+
+    def fire(self):
+        if self.mode == self.PERIODIC:
+            self.deadline += self.period_us
+        else:
+            self.deinit()
+        if self.callback:
+            self.callback(self)
+
+    def deinit(self):
+        if self in self.board.timers:
+            self.board.timers.remove(self)
+
+
+class WLAN:
+    def __init__(self, interface=0):
+        self.interface = interface
+        self._active = False
+        self._config = {'essid': ''}
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+
+    def connect(self, ssid=None, key=None):
+        self._active = True
+
+    def isconnected(self):
+        return self._active
@@ -1,6 +1,12 @@
 import network
 from machine import Pin
-import socket 
+from response_cache import CachedResponse
+from router import Router
+import webserver
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 
 led = Pin(2, Pin.OUT)
 led.value(0)  # Start with LED ON
@@ -49,33 +55,8 @@ def create_wifi():
     ap.config(essid="Car", password="12345678")
     print("Access Point Created")
 
-# Web server
-def start_server():
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    s = socket.socket()
-    s.bind(addr)
-    s.listen(5)
-    print("Server is running...")
-    while True:
-        client, addr = s.accept()
-        print('Client connected from', addr)
-        request = client.recv(1024)
-        print("Request: ", request)
-        
-        # Extract command from the HTTP GET request
-        if '/forward' in request:
-            move_forward()
-        elif '/backward' in request:
-            move_backward()
-        elif '/left' in request:
-            turn_left()
-        elif '/right' in request:
-            turn_right()
-        elif '/stop' in request:
-            stop_car()
-
-        # Send HTML response
-        html = """<!DOCTYPE html>
+# Control page, encoded once at startup
+HTML = """<!DOCTYPE html>
 <html>
   <head>
     <title>RC Car Control</title>
@@ -118,17 +99,28 @@ def start_server():
   </body>
 </html>
 """
-        client.send("HTTP/1.1 200 OK\n")
-        client.send("Content-Type: text/html\n")
-        client.send("Connection: close\n\n")
-        client.sendall(html)
-        client.close()
+PAGE = CachedResponse(HTML, keep_alive=True)
+
+# Web server routes: only / serves the page, commands get an empty 204
+def command(action):
+    def handler():
+        action()
+        return webserver.NO_CONTENT
+    return handler
+
+routes = Router()
+routes.add('/', lambda: PAGE.buf)
+routes.add('/probes', webserver.probe_report)  # Stage timings (JSON)
+routes.add('/forward', command(move_forward))
+routes.add('/backward', command(move_backward))
+routes.add('/left', command(turn_left))
+routes.add('/right', command(turn_right))
+routes.add('/stop', command(stop_car))
 
 # Main
 try:
     create_wifi()
-    start_server()
+    asyncio.run(webserver.serve(webserver.routed(routes)))
 except KeyboardInterrupt:
     stop_car()
     print("Server stopped.")
-
@@ -0,0 +1,97 @@
+# Motor mixing matrices
+# A layout is one row per motor of coefficients for the four control axes
+# (thrust, rotation, pitch, roll). drone_udp feeds its left stick into
+# thrust/rotation and its right stick trims into pitch/roll.
+#
+# Coefficients are in 1/ONE units so that fractional arms (hex) still mix
+# in integer arithmetic: out = (sum of coef * axis) >> SHIFT, then clamped
+# through a lookup table sized for the layout. Layouts made only of 0 and
+# +/-ONE (the quads, diff_drive) are precompiled to signs and mixed as a
+# plain signed sum, without the scaling multiplies or the shift.
+try:
+    from uarray import array
+except ImportError:
+    from array import array
+
+SHIFT = 6
+ONE = 1 << SHIFT
+HALF = ONE // 2
+SIN60 = 55  # sin(60 deg) * ONE, the pitch arm of the hex's outer motors
+
+LAYOUTS = {
+    # Motors: front left, front right, back left, back right
+    'quad_x': (
+        (ONE, -ONE, ONE, -ONE),
+        (ONE, ONE, ONE, ONE),
+        (ONE, -ONE, -ONE, -ONE),
+        (ONE, ONE, -ONE, ONE),
+    ),
+    # Motors: front, right, back, left
+    'quad_plus': (
+        (ONE, 0, ONE, 0),
+        (ONE, ONE, 0, ONE),
+        (ONE, 0, -ONE, 0),
+        (ONE, -ONE, 0, -ONE),
+    ),
+    # Motors: front left, front right, right, back right, back left, left
+    'hex': (
+        (ONE, -HALF, SIN60, -HALF),
+        (ONE, HALF, SIN60, HALF),
+        (ONE, ONE, 0, ONE),
+        (ONE, HALF, -SIN60, HALF),
+        (ONE, -HALF, -SIN60, -HALF),
+        (ONE, -ONE, 0, -ONE),
+    ),
+    # Wheels: left, right (pitch and roll unused)
+    'diff_drive': (
+        (ONE, -ONE, 0, 0),
+        (ONE, ONE, 0, 0),
+    ),
+}
+
+
+class Mixer:
+    """Integer mix of axis values into clamped motor outputs"""
+
+    def __init__(self, rows, ranges, out_min=0, out_max=1023):
+        # ranges: (low, high) of each axis value, to size the clamp table
+        self.count = len(rows)
+        self.rows = tuple(tuple(row) for row in rows)
+        low = high = 0
+        for row in rows:
+            row_low = row_high = 0
+            for c, (axis_low, axis_high) in zip(row, ranges):
+                row_low += min(c * axis_low, c * axis_high)
+                row_high += max(c * axis_low, c * axis_high)
+            low = min(low, row_low >> SHIFT)
+            high = max(high, row_high >> SHIFT)
+        self.offset = -low
+        self.clamp = array('H', [max(out_min, min(out_max, v)) for v in range(low, high + 1)])
+        self.out = array('H', [out_min] * self.count)
+        if all(c in (0, ONE, -ONE) for row in rows for c in row):
+            self.signs = tuple(tuple(c // ONE for c in row) for row in rows)
+            self.mix = self._mix_signs
+
+    def _mix_signs(self, thrust, rotation, pitch, roll):
+        # mix() for unit layouts: the sum is exact, so no shift is needed
+        clamp = self.clamp
+        out = self.out
+        offset = self.offset
+        motor = 0
+        for s_thrust, s_rotation, s_pitch, s_roll in self.signs:
+            out[motor] = clamp[s_thrust * thrust + s_rotation * rotation + s_pitch * pitch
+                               + s_roll * roll + offset]
+            motor += 1
+        return out
+
+    def mix(self, thrust, rotation, pitch, roll):
+        """Motor outputs for one set of axis values (reused array)"""
+        clamp = self.clamp
+        out = self.out
+        offset = self.offset
+        motor = 0
+        for c_thrust, c_rotation, c_pitch, c_roll in self.rows:
+            out[motor] = clamp[((c_thrust * thrust + c_rotation * rotation + c_pitch * pitch
+                                 + c_roll * roll) >> SHIFT) + offset]
+            motor += 1
+        return out
@@ -0,0 +1,67 @@
+# Output stage with dirty tracking
+# Remembers the last value written to each channel (a PWM duty or a pin
+# level) and only touches the hardware when the value changes. At hover
+# or idle most control packets repeat the previous outputs, and every
+# skipped PWM write saves a register update (a timing-table rebuild on
+# the ESP8266's software PWM).
+try:
+    from uarray import array
+except ImportError:
+    from array import array
+
+UNKNOWN = -1  # Cached value of a channel whose hardware state is not known
+
+
+class OutputStage:
+    """Cached writes to a fixed set of channels, with write/skip counters"""
+
+    def __init__(self, writers, shared=()):
+        # writers: the setter of each channel, e.g. pwm.duty or pin.value
+        # shared: (a, b) channel pairs driving the same pin, such as a PWM
+        # and a level write on one GPIO; writing one forgets the other
+        self.writers = tuple(writers)
+        self.last = array('l', [UNKNOWN] * len(self.writers))
+        self.partner = array('b', [-1] * len(self.writers))
+        for a, b in shared:
+            self.partner[a] = b
+            self.partner[b] = a
+        self.writes = 0
+        self.skipped = 0
+
+    def set(self, channel, value):
+        """Write value unless the channel already holds it; True if written"""
+        if self.last[channel] == value:
+            self.skipped += 1
+            return False
+        self.writers[channel](value)
+        self.last[channel] = value
+        self.writes += 1
+        partner = self.partner[channel]
+        if partner >= 0:
+            self.last[partner] = UNKNOWN
+        return True
+
+    def set_all(self, values):
+        """set() every channel from a sequence in channel order"""
+        # Inlined set(): this runs on every control tick
+        last = self.last
+        writers = self.writers
+        partners = self.partner
+        for channel in range(len(writers)):
+            value = values[channel]
+            if last[channel] == value:
+                self.skipped += 1
+                continue
+            writers[channel](value)
+            last[channel] = value
+            self.writes += 1
+            if partners[channel] >= 0:
+                last[partners[channel]] = UNKNOWN
+
+    def invalidate(self):
+        """Forget every cached value, e.g. after something else drove the pins"""
+        for channel in range(len(self.last)):
+            self.last[channel] = UNKNOWN
+
+    def stats(self):
+        return {'writes': self.writes, 'skipped': self.skipped}
@@ -1,6 +1,9 @@
 import network
 from machine import Pin, PWM
 import socket
+from router import Router
+from request_buffer import RequestBuffer
+from template import Template
 
 # Motor control pins setup
 motor1_in1 = PWM(Pin(4))  # GPIO5 -> Motor 1 IN1
@@ -67,41 +70,61 @@ def decrease_speed():
         motor_on()
 
 
-# Web page HTML
-def web_page():
+def set_led(state):
     global led_state
-    html = f"""
+    led.value(1 if state == "on" else 0)
+    led_state = state
+
+
+# Request routes
+routes = Router()
+routes.add('/motor/on', motor_on)
+routes.add('/motor/off', motor_off)
+routes.add('/speed/up', increase_speed)
+routes.add('/speed/down', decrease_speed)
+routes.add('/led/on', lambda: set_led("on"))
+routes.add('/led/off', lambda: set_led("off"))
+
+
+# Web page HTML, compiled once and streamed with the live values
+PAGE = Template("""
     <html>
     <head>
         <meta name="viewport" content="width=device-width, initial-scale=1">
         <title>Motor Control</title>
         <style>
-            body {{ font-family: Arial, sans-serif; text-align: center; }}
-            button {{ padding: 10px; margin: 5px; width: 150px; }}
-            h1 {{ color: #333; }}
-            p {{ font-size: 18px; }}
+            body { font-family: Arial, sans-serif; text-align: center; }
+            button { padding: 10px; margin: 5px; width: 150px; }
+            h1 { color: #333; }
+            p { font-size: 18px; }
         </style>
     </head>
     <body>
         <h1>Motor Control</h1>
-        <p>LED: <strong>{led_state}</strong></p>
+        <p>LED: <strong>{{led_state}}</strong></p>
         <button onclick="location.href='/led/on'">LED ON</button>
         <button onclick="location.href='/led/off'">LED OFF</button>
         <br/>
-        <p>Status: <strong>{motor_state}</strong></p>
+        <p>Status: <strong>{{motor_state}}</strong></p>
         <button onclick="location.href='/motor/on'">Turn Motors ON</button>
         <button onclick="location.href='/motor/off'">Turn Motors OFF</button>
         <br/>
-        <p>Speed: <strong>{speed}</strong></p>
+        <p>Speed: <strong>{{speed}}</strong></p>
         <button onclick="location.href='/speed/up'">Increase Speed</button>
         <button onclick="location.href='/speed/down'">Decrease Speed</button>
     </body>
     </html>
-    """
-    return html
+    """, keep_alive=False)
+
+
+def page_values():
+    return {"led_state": led_state, "motor_state": motor_state, "speed": speed}
 
 
 # Web server handler
+request = RequestBuffer()  # Reused for every connection
+
+
 def web_server():
     addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
     s = socket.socket()
@@ -112,28 +135,12 @@ def web_server():
     while True:
         cl, addr = s.accept()
         print('Client connected from', addr)
-        request = cl.recv(1024).decode('utf-8')
-        print('Request:', request)
-
         # URL handling
-        if '/motor/on' in request:
-            motor_on()
-        elif '/motor/off' in request:
-            motor_off()
-        elif '/speed/up' in request:
-            increase_speed()
-        elif '/speed/down' in request:
-            decrease_speed()
-        elif '/led/on' in request:
-            led.value(1)
-            led_state = "on"
-        elif '/led/off' in request:
-            led.value(0)
-            led_state = "off"
-
-        response = web_page()
-        cl.send('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n')
-        cl.sendall(response)
+        if request.read_socket(cl):
+            print('Request:', request.method, request.path)
+            routes.dispatch_buf(request)
+
+        PAGE.send(cl, page_values())
         cl.close()
 
 
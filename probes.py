@@ -0,0 +1,76 @@
+# Stage timing probes
+# Each stage keeps its last SIZE durations (microseconds) in a slice of one
+# preallocated array used as a ring buffer, so recording a sample allocates
+# nothing. summary() sorts a copy and is meant for the occasional query.
+#
+#   t = probes.start()
+#   ... recv ...
+#   t = probes.mark(RECV, t)   # records recv, returns the new start
+#   ... parse ...
+#   probes.mark(PARSE, t)
+import json
+import time
+try:
+    from uarray import array
+except ImportError:
+    from array import array
+
+SIZE = 128  # Samples kept per stage
+
+if hasattr(time, 'ticks_us'):
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+else:
+    # CPython: same interface on the host's monotonic clock
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+
+class Probes:
+    """Ring buffers of stage durations, indexed by stage number"""
+
+    def __init__(self, stages, size=SIZE):
+        self.stages = tuple(stages)
+        self.size = size
+        self.samples = array('l', [0] * (len(self.stages) * size))
+        self.counts = array('l', [0] * len(self.stages))  # Samples ever taken
+
+    def start(self):
+        return ticks_us()
+
+    def mark(self, stage, start):
+        """Record the time since start for stage; returns the current ticks"""
+        now = ticks_us()
+        count = self.counts[stage]
+        self.samples[stage * self.size + count % self.size] = ticks_diff(now, start)
+        self.counts[stage] = count + 1
+        return now
+
+    def reset(self):
+        for stage in range(len(self.stages)):
+            self.counts[stage] = 0
+
+    def summary(self):
+        """{stage: {n, min, mean, p99, max}} over the samples held"""
+        result = {}
+        for stage, name in enumerate(self.stages):
+            held = min(self.counts[stage], self.size)
+            if not held:
+                result[name] = {'n': 0}
+                continue
+            first = stage * self.size
+            values = sorted(self.samples[first:first + held])
+            result[name] = {
+                'n': self.counts[stage],
+                'min': values[0],
+                'mean': sum(values) // held,
+                'p99': values[(held * 99 + 99) // 100 - 1],  # Nearest rank
+                'max': values[-1],
+            }
+        return result
+
+    def report(self):
+        return json.dumps(self.summary())
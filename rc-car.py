@@ -1,8 +1,31 @@
 import network
-from machine import Pin, PWM
+from machine import Pin, PWM, Timer
 import socket
-import gc
-import uasyncio as asyncio
+from output_stage import OutputStage
+from response_cache import CachedResponse, NO_CACHE, IMMUTABLE
+from router import Router
+import webserver
+import websocket
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+try:
+    import utime as time
+except ImportError:
+    import time
+try:
+    import uselect as select
+except ImportError:
+    import select
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    from uarray import array
+except ImportError:
+    from array import array
 
 # Motor control pins setup
 motor1A = Pin(5, Pin.OUT)  # D1
@@ -18,6 +41,24 @@ current_state = 'stop'  # Track current movement state
 MAX_SPEED = 1023
 SPEED_INCREMENT = 50
 
+# Boost and brake ramps run on the car from a timer, so a held button
+# costs one request to start and one to stop, and the ramp stays smooth
+# whatever the network does. Slopes are in speed units per second.
+RAMP_TIMER = -1  # Timer id (-1: virtual timer)
+RAMP_HZ = 20
+BOOST_SLOPE = 500   # The old 50 per /accelerate every 100 ms
+BRAKE_SLOPE = 1000  # The old 100 per /brake every 100 ms
+ramp_timer = Timer(RAMP_TIMER)
+ramp_step = 0  # Speed change per tick; 0 while no ramp runs
+
+# All motor writes go through the output stage, which skips values the
+# hardware already holds. motor1A/motor2A carry the PWM as well, so a
+# level write there and a duty write on its PWM forget each other.
+PWM1, PWM2, PIN_1A, PIN_1B, PIN_2A, PIN_2B = range(6)
+outputs = OutputStage((pwm1.duty, pwm2.duty, motor1A.value, motor1B.value,
+                       motor2A.value, motor2B.value),
+                      shared=((PWM1, PIN_1A), (PWM2, PIN_2A)))
+
 # Onboard LED setup
 led = Pin(2, Pin.OUT)
 led.value(0)
@@ -32,29 +73,30 @@ def create_wifi():
 
 # Enhanced motor control functions with dynamic speed
 def apply_motor_speed():
+    write = outputs.set
     if current_state == 'forward':
-        motor1B.off()
-        motor2B.off()
-        pwm1.duty(speed)
-        pwm2.duty(speed)
+        write(PIN_1B, 0)
+        write(PIN_2B, 0)
+        write(PWM1, speed)
+        write(PWM2, speed)
     elif current_state == 'backward':
-        motor1A.off()
-        motor2A.off()
-        motor1B.on()
-        motor2B.on()
-        pwm1.duty(speed)
-        pwm2.duty(speed)
+        write(PIN_1A, 0)
+        write(PIN_2A, 0)
+        write(PIN_1B, 1)
+        write(PIN_2B, 1)
+        write(PWM1, speed)
+        write(PWM2, speed)
     elif current_state == 'left':
-        motor1A.off()
-        pwm2.duty(speed)
+        write(PIN_1A, 0)
+        write(PWM2, speed)
     elif current_state == 'right':
-        motor2A.off()
-        pwm1.duty(speed)
+        write(PIN_2A, 0)
+        write(PWM1, speed)
     elif current_state == 'boost':
-        motor1B.off()
-        motor2B.off()
-        pwm1.duty(speed)
-        pwm2.duty(speed)
+        write(PIN_1B, 0)
+        write(PIN_2B, 0)
+        write(PWM1, speed)
+        write(PWM2, speed)
 
 def start_boost():
     global current_state, speed
@@ -86,10 +128,11 @@ def turn_right():
 def stop_car():
     global current_state
     current_state = 'stop'
-    pwm1.duty(0)
-    pwm2.duty(0)
-    motor1B.off()
-    motor2B.off()
+    stop_ramp()
+    outputs.set(PWM1, 0)
+    outputs.set(PWM2, 0)
+    outputs.set(PIN_1B, 0)
+    outputs.set(PIN_2B, 0)
 
 def increase_speed():
     global speed
@@ -103,156 +146,275 @@ def decrease_speed():
     apply_motor_speed()
     return speed
 
-# Web server
-def web_server():
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    s = socket.socket()
-    s.bind(addr)
-    s.listen(5)
-    print("Server is running...")
+def ramp_tick(timer=None):
+    """One ramp step; the ramp ends by itself at either speed limit"""
+    global speed
+    speed = max(0, min(MAX_SPEED, speed + ramp_step))
+    apply_motor_speed()
+    if speed == 0 or speed == MAX_SPEED:
+        stop_ramp()
 
-    while True:
-        gc.collect()
-        try:
-            cl, addr = s.accept()
-            request = str(cl.recv(1024))
-
-            response_data = None
-
-            # Extract command from the HTTP GET request
-            if 'GET /forward' in request:
-                move_forward()
-            elif 'GET /backward' in request:
-                move_backward()
-            elif 'GET /left' in request:
-                turn_left()
-            elif 'GET /right' in request:
-                turn_right()
-            elif 'GET /stop' in request:
-                stop_car()
-            elif 'GET /startBoost' in request:
-                response_data = {"speed": start_boost()}
-            elif 'GET /accelerate' in request:
-                response_data = {"speed": increase_speed()}
-            elif 'GET /brake' in request:
-                response_data = {"speed": decrease_speed()}
-
-            if response_data:
-                response = f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{str(response_data)}"
-                cl.send(response)
-            else:
-                # Send HTML interface with updated JavaScript
-                # [Previous imports and setup code remains the same until the HTML part]
-
-                html = """<!DOCTYPE html>
+def start_ramp(slope):
+    global ramp_step
+    ramp_step = slope // RAMP_HZ
+    ramp_timer.init(mode=Timer.PERIODIC, freq=RAMP_HZ, callback=ramp_tick)
+
+def stop_ramp():
+    global ramp_step
+    if ramp_step:
+        ramp_timer.deinit()
+        ramp_step = 0
+
+def boost_start():
+    start_boost()
+    start_ramp(BOOST_SLOPE)
+    return speed
+
+def boost_stop():
+    # Letting go of BOOST stops the car, as it always has
+    stop_car()
+    return speed
+
+def brake_start():
+    start_ramp(-BRAKE_SLOPE)
+    return speed
+
+def brake_stop():
+    stop_ramp()
+    return speed
+
+# Controller UI
+# Styles and script are separate versioned assets that the browser keeps
+CSS = """body {
+    margin: 0;
+    padding: 20px;
+    display: flex;
+    justify-content: space-between;
+    background-color: #1a1a1a;
+    color: white;
+    font-family: Arial, sans-serif;
+    height: 100vh;
+    box-sizing: border-box;
+    user-select: none;
+}
+.left-controls {
+    display: grid;
+    grid-template-areas:
+        ". . ."
+        "left . right"
+        ". down .";
+    gap: 15px;
+    margin-right: 20px;
+}
+.right-controls {
+    display: flex;
+    flex-direction: column;
+    gap: 20px;
+}
+button {
+    width: 80px;
+    height: 80px;
+    border: none;
+    border-radius: 50%;
+    background: linear-gradient(145deg, #2e2e2e, #1a1a1a);
+    box-shadow: 5px 5px 10px #0d0d0d,
+               -5px -5px 10px #272727;
+    color: #fff;
+    font-size: 24px;
+    cursor: pointer;
+    transition: all 0.2s;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+}
+button:active {
+    box-shadow: inset 5px 5px 10px #0d0d0d,
+               inset -5px -5px 10px #272727;
+    transform: scale(0.95);
+}
+.speed-button {
+    width: 120px;
+    height: 120px;
+    font-size: 18px;
+    font-weight: bold;
+    border-radius: 50%;
+}
+#boostBtn {
+    background: linear-gradient(145deg, #ff4444, #cc0000);
+    position: relative;
+    overflow: hidden;
+}
+#boostBtn.active::after {
+    content: '';
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    background: rgba(255, 255, 255, 0.3);
+    animation: pulse 0.5s infinite alternate;
+}
+#brakeBtn {
+    background: linear-gradient(145deg, #666666, #333333);
+}
+@keyframes pulse {
+    from { opacity: 0.3; }
+    to { opacity: 0.6; }
+}
+#speedometer {
+    position: fixed;
+    top: 20px;
+    left: 50%;
+    transform: translateX(-50%);
+    font-size: 24px;
+    font-weight: bold;
+    text-align: center;
+    background: rgba(0, 0, 0, 0.5);
+    padding: 10px 20px;
+    border-radius: 20px;
+}
+.speed-bar {
+    width: 200px;
+    height: 10px;
+    background: #333;
+    border-radius: 5px;
+    margin-top: 5px;
+    overflow: hidden;
+}
+.speed-fill {
+    height: 100%;
+    width: 0%;
+    background: linear-gradient(to right, #ff4444, #ff0000);
+    transition: width 0.2s;
+}
+"""
+
+JS = """let currentSpeed = 0;
+const speedDisplay = document.getElementById('speedValue');
+const speedFill = document.getElementById('speedFill');
+const boostBtn = document.getElementById('boostBtn');
+const brakeBtn = document.getElementById('brakeBtn');
+
+function updateSpeedDisplay(speed) {
+    currentSpeed = Math.floor((speed / 1023) * 100);
+    speedDisplay.textContent = currentSpeed;
+    speedFill.style.width = currentSpeed + '%';
+}
+
+// Commands go over the WebSocket as [command, value] byte pairs;
+// plain fetch() is only the fallback while it is not connected
+const STEER = {stop: 0, forward: 1, backward: 2, left: 3, right: 4};
+const BOOST = {startBoost: 0, accelerate: 1, brake: 2,
+               'boost/start': 3, 'boost/stop': 4, 'brake/start': 5, 'brake/stop': 6};
+let ws = null;
+
+function connectSocket() {
+    ws = new WebSocket('ws://' + location.host + '/ws');
+    ws.binaryType = 'arraybuffer';
+    ws.onmessage = (event) => {
+        const data = new DataView(event.data);
+        if (data.getUint8(0) === 0x10) {
+            updateSpeedDisplay(data.getUint16(1));
+        }
+    };
+    ws.onclose = () => {
+        ws = null;
+        setTimeout(connectSocket, 1000);
+    };
+}
+connectSocket();
+
+function sendCommand(command) {
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        if (command in STEER) {
+            ws.send(new Uint8Array([0x01, STEER[command]]));
+        } else if (command in BOOST) {
+            ws.send(new Uint8Array([0x03, BOOST[command]]));
+        }
+        return;
+    }
+    fetch('/' + command)
+        .then(response => {
+            if (command in BOOST) {
+                return response.json();
+            }
+        })
+        .then(data => {
+            if (data && data.speed !== undefined) {
+                updateSpeedDisplay(data.speed);
+            }
+        })
+        .catch(err => console.log("Error:", err));
+}
+
+// Boost and brake ramp on the car while the button is held: one
+// command on press, one on release
+let isBoostActive = false;
+
+function startBoost() {
+    if (isBoostActive) return;
+    isBoostActive = true;
+    boostBtn.classList.add('active');
+    sendCommand('boost/start');
+}
+
+function stopBoost() {
+    if (!isBoostActive) return;
+    isBoostActive = false;
+    boostBtn.classList.remove('active');
+    sendCommand('boost/stop');
+}
+
+// Mouse events
+boostBtn.addEventListener('mousedown', startBoost);
+boostBtn.addEventListener('mouseup', stopBoost);
+boostBtn.addEventListener('mouseleave', stopBoost);
+
+// Touch events
+boostBtn.addEventListener('touchstart', (e) => {
+    e.preventDefault();
+    startBoost();
+});
+boostBtn.addEventListener('touchend', (e) => {
+    e.preventDefault();
+    stopBoost();
+});
+
+// Brake button handling
+let isBrakeActive = false;
+
+function startBrake() {
+    if (isBrakeActive) return;
+    isBrakeActive = true;
+    sendCommand('brake/start');
+}
+
+function stopBrake() {
+    if (!isBrakeActive) return;
+    isBrakeActive = false;
+    sendCommand('brake/stop');
+}
+
+brakeBtn.addEventListener('mousedown', startBrake);
+brakeBtn.addEventListener('mouseup', stopBrake);
+brakeBtn.addEventListener('mouseleave', stopBrake);
+
+brakeBtn.addEventListener('touchstart', (e) => {
+    e.preventDefault();
+    startBrake();
+});
+brakeBtn.addEventListener('touchend', (e) => {
+    e.preventDefault();
+    stopBrake();
+});
+"""
+
+HTML = """<!DOCTYPE html>
 <html>
 <head>
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>RC Car Game Controller</title>
-    <style>
-        body {
-            margin: 0;
-            padding: 20px;
-            display: flex;
-            justify-content: space-between;
-            background-color: #1a1a1a;
-            color: white;
-            font-family: Arial, sans-serif;
-            height: 100vh;
-            box-sizing: border-box;
-            user-select: none;
-        }
-        .left-controls {
-            display: grid;
-            grid-template-areas:
-                ". . ."
-                "left . right"
-                ". down .";
-            gap: 15px;
-            margin-right: 20px;
-        }
-        .right-controls {
-            display: flex;
-            flex-direction: column;
-            gap: 20px;
-        }
-        button {
-            width: 80px;
-            height: 80px;
-            border: none;
-            border-radius: 50%;
-            background: linear-gradient(145deg, #2e2e2e, #1a1a1a);
-            box-shadow: 5px 5px 10px #0d0d0d,
-                       -5px -5px 10px #272727;
-            color: #fff;
-            font-size: 24px;
-            cursor: pointer;
-            transition: all 0.2s;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        button:active {
-            box-shadow: inset 5px 5px 10px #0d0d0d,
-                       inset -5px -5px 10px #272727;
-            transform: scale(0.95);
-        }
-        .speed-button {
-            width: 120px;
-            height: 120px;
-            font-size: 18px;
-            font-weight: bold;
-            border-radius: 50%;
-        }
-        #boostBtn {
-            background: linear-gradient(145deg, #ff4444, #cc0000);
-            position: relative;
-            overflow: hidden;
-        }
-        #boostBtn.active::after {
-            content: '';
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background: rgba(255, 255, 255, 0.3);
-            animation: pulse 0.5s infinite alternate;
-        }
-        #brakeBtn {
-            background: linear-gradient(145deg, #666666, #333333);
-        }
-        @keyframes pulse {
-            from { opacity: 0.3; }
-            to { opacity: 0.6; }
-        }
-        #speedometer {
-            position: fixed;
-            top: 20px;
-            left: 50%;
-            transform: translateX(-50%);
-            font-size: 24px;
-            font-weight: bold;
-            text-align: center;
-            background: rgba(0, 0, 0, 0.5);
-            padding: 10px 20px;
-            border-radius: 20px;
-        }
-        .speed-bar {
-            width: 200px;
-            height: 10px;
-            background: #333;
-            border-radius: 5px;
-            margin-top: 5px;
-            overflow: hidden;
-        }
-        .speed-fill {
-            height: 100%;
-            width: 0%;
-            background: linear-gradient(to right, #ff4444, #ff0000);
-            transition: width 0.2s;
-        }
-    </style>
+    <link rel="stylesheet" href="/app.css?v={{style}}">
 </head>
 <body>
     <div id="speedometer">
@@ -273,109 +435,278 @@ def web_server():
         <button class="speed-button" id="brakeBtn">BRAKE</button>
     </div>
 
-    <script>
-        let currentSpeed = 0;
-        const speedDisplay = document.getElementById('speedValue');
-        const speedFill = document.getElementById('speedFill');
-        const boostBtn = document.getElementById('boostBtn');
-        const brakeBtn = document.getElementById('brakeBtn');
-        
-        function updateSpeedDisplay(speed) {
-            currentSpeed = Math.floor((speed / 1023) * 100);
-            speedDisplay.textContent = currentSpeed;
-            speedFill.style.width = currentSpeed + '%';
-        }
+    <script src="/app.js?v={{script}}"></script>
+</body>
+</html>
+"""
 
-        function sendCommand(command) {
-            fetch('/' + command)
-                .then(response => {
-                    if (['accelerate', 'brake', 'startBoost'].includes(command)) {
-                        return response.json();
-                    }
-                })
-                .then(data => {
-                    if (data && data.speed !== undefined) {
-                        updateSpeedDisplay(data.speed);
-                    }
-                })
-                .catch(err => console.log("Error:", err));
-        }
+# WebSocket control channel
+# Browser -> car frames are [command, value...], car -> browser [WS_SPEED, hi, lo]
+WS_STEER = 0x01     # 1 byte: 0 stop, 1 forward, 2 backward, 3 left, 4 right
+WS_THROTTLE = 0x02  # uint16 big-endian speed (0-1023)
+WS_BOOST = 0x03     # 1 byte: 0 start boost, 1 accelerate, 2 brake,
+                    # 3/4 boost ramp start/stop, 5/6 brake ramp start/stop
+WS_SPEED = 0x10     # uint16 big-endian current speed
 
-        // Enhanced Boost button handling
-        let boostInterval;
-        let isBoostActive = false;
+STEER_ACTIONS = (stop_car, move_forward, move_backward, turn_left, turn_right)
+BOOST_ACTIONS = (start_boost, increase_speed, decrease_speed,
+                 boost_start, boost_stop, brake_start, brake_stop)
 
-        function startBoost() {
-            if (!isBoostActive) {
-                // Initial boost start
-                sendCommand('startBoost');
-            }
-            isBoostActive = true;
-            boostBtn.classList.add('active');
-            // Continue increasing speed while held
-            boostInterval = setInterval(() => {
-                sendCommand('accelerate');
-            }, 100);
-        }
+ws_clients = []
+speed_frame = bytearray((WS_SPEED, 0, 0))  # Reused for every speed push
+pushed_speed = -1  # Speed in the last push
+SPEED_PUSH_MS = 100  # How often a running ramp's speed is pushed
 
-        function stopBoost() {
-            isBoostActive = false;
-            boostBtn.classList.remove('active');
-            clearInterval(boostInterval);
-            sendCommand('stop');
-        }
+def set_speed(value):
+    global speed
+    speed = max(0, min(MAX_SPEED, value))
+    apply_motor_speed()
+    return speed
 
-        // Mouse events
-        boostBtn.addEventListener('mousedown', startBoost);
-        boostBtn.addEventListener('mouseup', stopBoost);
-        boostBtn.addEventListener('mouseleave', stopBoost);
-
-        // Touch events
-        boostBtn.addEventListener('touchstart', (e) => {
-            e.preventDefault();
-            startBoost();
-        });
-        boostBtn.addEventListener('touchend', (e) => {
-            e.preventDefault();
-            stopBoost();
-        });
-
-        // Brake button handling
-        let brakeInterval;
-        brakeBtn.addEventListener('mousedown', () => {
-            brakeInterval = setInterval(() => {
-                sendCommand('brake');
-            }, 100);
-        });
-        brakeBtn.addEventListener('mouseup', () => clearInterval(brakeInterval));
-        brakeBtn.addEventListener('mouseleave', () => clearInterval(brakeInterval));
-
-        brakeBtn.addEventListener('touchstart', (e) => {
-            e.preventDefault();
-            brakeInterval = setInterval(() => {
-                sendCommand('brake');
-            }, 100);
-        });
-        brakeBtn.addEventListener('touchend', (e) => {
-            e.preventDefault();
-            clearInterval(brakeInterval);
-        });
-    </script>
-</body>
-</html>
-"""
-                cl.send("HTTP/1.1 200 OK\r\n")
-                cl.send("Content-Type: text/html\r\n")
-                cl.send("Connection: close\r\n\r\n")
-                cl.sendall(html)
-            
-            cl.close()
-        except Exception as e:
-            print("Connection handling error:", e)
+def push_speed():
+    global pushed_speed
+    pushed_speed = speed
+    speed_frame[1] = speed >> 8
+    speed_frame[2] = speed & 0xFF
+    for ws in ws_clients:
+        ws.send(speed_frame)
+
+def handle_ws_command(data):
+    if len(data) < 2:
+        return
+    command = data[0]
+    if command == WS_STEER and data[1] < len(STEER_ACTIONS):
+        STEER_ACTIONS[data[1]]()
+    elif command == WS_THROTTLE and len(data) > 2:
+        set_speed(data[1] << 8 | data[2])
+        push_speed()
+    elif command == WS_BOOST and data[1] < len(BOOST_ACTIONS):
+        BOOST_ACTIONS[data[1]]()
+        push_speed()
+
+async def ws_session(req):
+    ws = await websocket.accept(req)
+    if ws is None:
+        return
+    ws_clients.append(ws)
+    try:
+        push_speed()
+        while True:
+            message = await ws.recv()
+            if message is None:
+                break
+            handle_ws_command(message[1])
+            await req.writer.drain()
+    finally:
+        ws_clients.remove(ws)
+
+async def speed_pusher():
+    # The ramp timer only changes the speed; pages are told from here,
+    # outside the timer callback
+    while True:
+        await asyncio.sleep(SPEED_PUSH_MS / 1000)
+        if speed != pushed_speed and ws_clients:
+            push_speed()
+            for ws in ws_clients[:]:
+                try:
+                    await ws.writer.drain()
+                except OSError:
+                    pass
+
+# UDP joystick control, beside the web UI
+# Same packets and port as drone_udp.py, so the same controllers (and
+# ground_station.py) can drive the car without TCP setup or HTTP parsing:
+#   uint16 left_x, left_y, right_x, right_y (1000-2000), uint8 seq, uint8 flags
+# Throttle and steering add into signed left/right wheel speeds.
+# main.py and rough.py stay HTTP-only: main.py switches its pins on and
+# off with no PWM, so it has no proportional speed to steer with, and
+# rough.py serves from a blocking accept() loop with nowhere to poll UDP.
+UDP_PORT = 50000
+PACKET_FORMAT = '<4HBB'
+PACKET_SIZE = struct.calcsize(PACKET_FORMAT)
+FLAG_STOP = 0x01
+FLAG_ACK = 0x02
+# Off by default, as in drone_udp: on MicroPython acks need recvfrom (one
+# small allocation per packet) instead of the allocation-free readinto
+ACK_PACKETS = False
+ACK_TYPE = 0xA1
+JOYSTICK_MIN = 1000
+JOYSTICK_MAX = 2000
+JOYSTICK_MID = 1500
+THROTTLE_AXIS = 1  # left_y
+STEER_AXIS = 2     # right_x
+DEADBAND = 30      # Stick units around the centre that count as centred
+UDP_POLL_MS = 5    # Queue check interval while waiting for packets
+LINK_TIMEOUT_MS = 250  # The car stops when packets stop for this long
+
+udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+udp_socket.bind(('0.0.0.0', UDP_PORT))
+udp_socket.setblocking(False)
+packet_buf = bytearray(16)
+packet_addr = None  # Sender of the last datagram, where it is known
+ack_buf = bytearray((ACK_TYPE, 0))
+last_packet_ms = 0
+
+# The queue is checked with a zero-timeout poll before reading, so an empty
+# queue costs no EAGAIN OSError (an allocation) every UDP_POLL_MS
+udp_poller = select.poll()
+udp_poller.register(udp_socket, select.POLLIN)
+
+if hasattr(udp_poller, 'ipoll'):
+    def udp_ready():
+        # MicroPython's ipoll reuses its result tuple
+        for ready in udp_poller.ipoll(0):
+            return True
+        return False
+else:
+    def udp_ready():
+        return bool(udp_poller.poll(0))
+
+if hasattr(udp_socket, 'recvfrom_into'):
+    def receive_datagram():
+        """Receive one datagram into packet_buf; returns its length"""
+        global packet_addr
+        n, packet_addr = udp_socket.recvfrom_into(packet_buf)
+        return n
+elif ACK_PACKETS:
+    def receive_datagram():
+        """Receive one datagram into packet_buf; returns its length"""
+        # MicroPython sockets: only recvfrom() tells where to send the ack
+        global packet_addr
+        data, packet_addr = udp_socket.recvfrom(len(packet_buf))
+        packet_buf[:len(data)] = data
+        return len(data)
+else:
+    def receive_datagram():
+        """Receive one datagram into packet_buf; returns its length"""
+        # MicroPython sockets: readinto() reads one datagram
+        return udp_socket.readinto(packet_buf)
+
+def stick_speed(value):
+    """Stick position to a signed speed, with a deadband around the centre"""
+    offset = value - JOYSTICK_MID
+    if -DEADBAND <= offset <= DEADBAND:
+        return 0
+    span = JOYSTICK_MID - JOYSTICK_MIN - DEADBAND
+    offset += -DEADBAND if offset > 0 else DEADBAND
+    return max(-MAX_SPEED, min(MAX_SPEED, offset * MAX_SPEED // span))
+
+# Built once, so a packet costs two table lookups and two clamps
+STICK_TABLE = array('h', [stick_speed(v) for v in range(JOYSTICK_MIN, JOYSTICK_MAX + 1)])
+
+def drive_wheel(pwm, pin_b, value):
+    write = outputs.set
+    if value >= 0:
+        write(pin_b, 0)
+        write(pwm, value)
+    else:
+        # IN2 high: the wheel turns backwards while the PWM on IN1 is low
+        write(pin_b, 1)
+        write(pwm, MAX_SPEED + value)
+
+def drive(throttle, steer):
+    """Differential drive from signed throttle and steering speeds"""
+    global current_state
+    current_state = 'udp'
+    # Two wheels need no mixing table: steering right speeds up the left wheel
+    drive_wheel(PWM1, PIN_1B, max(-MAX_SPEED, min(MAX_SPEED, throttle + steer)))
+    drive_wheel(PWM2, PIN_2B, max(-MAX_SPEED, min(MAX_SPEED, throttle - steer)))
+
+def receive_packet():
+    """Newest valid packet in the queue, or None; acks packets that ask"""
+    newest = None
+    while udp_ready():
+        try:
+            n = receive_datagram()
+        except OSError:
+            break
+        if n != PACKET_SIZE:
+            continue
+        packet = struct.unpack_from(PACKET_FORMAT, packet_buf)
+        if ACK_PACKETS and packet[5] & FLAG_ACK and packet_addr:
+            ack_buf[1] = packet[4]
+            try:
+                udp_socket.sendto(ack_buf, packet_addr)
+            except OSError:
+                pass
+        for axis in range(4):
+            if not JOYSTICK_MIN <= packet[axis] <= JOYSTICK_MAX:
+                break
+        else:
+            newest = packet  # Latest wins: a burst never replays old input
+    return newest
+
+def poll_udp():
+    """Apply the newest queued packet; stop the car when the link goes quiet"""
+    global last_packet_ms
+    packet = receive_packet()
+    now = time.ticks_ms()
+    if packet is not None:
+        last_packet_ms = now
+        if packet[5] & FLAG_STOP:
+            stop_car()
+        else:
+            drive(STICK_TABLE[packet[THROTTLE_AXIS] - JOYSTICK_MIN],
+                  STICK_TABLE[packet[STEER_AXIS] - JOYSTICK_MIN])
+    elif current_state == 'udp' and time.ticks_diff(now, last_packet_ms) > LINK_TIMEOUT_MS:
+        stop_car()
+
+async def udp_control():
+    while True:
+        poll_udp()
+        await asyncio.sleep(UDP_POLL_MS / 1000)
+
+# Responses are encoded once; only the speed value is patched per request
+STYLE = CachedResponse(CSS, 'text/css', keep_alive=True, cache_control=IMMUTABLE)
+SCRIPT = CachedResponse(JS, 'application/javascript', keep_alive=True, cache_control=IMMUTABLE)
+PAGE = CachedResponse(HTML.replace('{{style}}', STYLE.hash).replace('{{script}}', SCRIPT.hash),
+                      keep_alive=True, cache_control=NO_CACHE)
+SPEED_RESPONSE = CachedResponse('{"speed": {{speed}}}', 'application/json', {'speed': 4}, keep_alive=True)
+
+# Web server routes
+# Movement commands answer with the page, speed commands with the new speed
+def page_command(action):
+    def handler():
+        action()
+        return PAGE.buf
+    return handler
+
+def speed_command(action):
+    def handler():
+        SPEED_RESPONSE.set('speed', action())
+        push_speed()
+        return SPEED_RESPONSE.buf
+    return handler
+
+routes = Router()
+routes.add('/', lambda: PAGE)
+routes.add('/probes', webserver.probe_report)  # Stage timings (JSON)
+routes.add('/app.css', lambda: STYLE)
+routes.add('/app.js', lambda: SCRIPT)
+routes.add('/ws', lambda: ws_session)
+routes.add('/forward', page_command(move_forward))
+routes.add('/backward', page_command(move_backward))
+routes.add('/left', page_command(turn_left))
+routes.add('/right', page_command(turn_right))
+routes.add('/stop', page_command(stop_car))
+routes.add('/startBoost', speed_command(start_boost))
+routes.add('/accelerate', speed_command(increase_speed))
+routes.add('/brake', speed_command(decrease_speed))
+routes.add('/boost/start', speed_command(boost_start))
+routes.add('/boost/stop', speed_command(boost_stop))
+routes.add('/brake/start', speed_command(brake_start))
+routes.add('/brake/stop', speed_command(brake_stop))
+
+async def main():
+    asyncio.create_task(speed_pusher())
+    asyncio.create_task(udp_control())
+    await webserver.serve(webserver.routed(routes))
 
 # Setup function
 def setup():
     create_wifi()
-    web_server()
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    setup()
 
-setup()
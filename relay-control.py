@@ -1,6 +1,14 @@
 import network
-import socket
 from machine import Pin
+from router import Router
+from response_cache import CachedResponse, NO_CACHE, IMMUTABLE
+from device_state import DeviceState
+from sse import EventSource
+import webserver
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 
 # Setup LED (GPIO 2) AND relays (GPIO 5 and GPIO 4)
 led = Pin(2, Pin.OUT)
@@ -22,47 +30,61 @@ print('Connect to Wi-Fi with SSID:', ap.config('essid'))
 print('IP Address:', ap.ifconfig()[0])
 
 
-# Non-blocking web page creation
-def web_page():
-    html = """<html>
+# Control page; styles and script are separate versioned assets the
+# browser keeps, and the page itself is revalidated with its ETag
+CSS = """body { font-family: Arial, sans-serif; text-align: center; }
+button { padding: 10px; margin: 5px; width: 150px; }
+h1 { color: #333; }
+p { font-size: 18px; }
+"""
+
+JS = """// Function to send requests to control the relays and LED
+function sendRequest(command) {
+    var xhttp = new XMLHttpRequest();
+    xhttp.open("GET", command, true);
+    xhttp.send();
+}
+
+function showStatus(status) {
+    document.getElementById("led_status").innerHTML = status.led_status;
+    document.getElementById("relay1_status").innerHTML = status.relay1_status;
+    document.getElementById("relay2_status").innerHTML = status.relay2_status;
+}
+
+function getStatus() {
+    var xhttp = new XMLHttpRequest();
+    xhttp.onreadystatechange = function() {
+        if (this.readyState == 4 && this.status == 200) {
+            showStatus(JSON.parse(this.responseText));
+        }
+    };
+    xhttp.open("GET", "/status", true);
+    xhttp.send();
+}
+
+// The device pushes the status whenever a relay or the LED changes;
+// browsers without EventSource fall back to polling every 2 seconds
+function startStatusUpdates() {
+    if (window.EventSource) {
+        var events = new EventSource("/events");
+        events.onmessage = function(event) {
+            showStatus(JSON.parse(event.data));
+        };
+    } else {
+        getStatus();
+        setInterval(getStatus, 2000);
+    }
+}
+"""
+
+HTML = """<html>
     <head>
         <meta name="viewport" content="width=device-width, initial-scale=1">
         <title>ESP8266 Control</title>
-          <style>
-            body {{ font-family: Arial, sans-serif; text-align: center; }}
-            button {{ padding: 10px; margin: 5px; width: 150px; }}
-            h1 {{ color: #333; }}
-            p {{ font-size: 18px; }}
-          </style>
-        <script>
-            // Function to send requests to control the relays and LED
-            function sendRequest(command) {
-                var xhttp = new XMLHttpRequest();
-                xhttp.open("GET", command, true);
-                xhttp.send();
-            }
-
-            // Function to periodically refresh the status of the relays and LED
-            setInterval(function() {
-                getStatus();
-            }, 2000);  // Refresh every 2 seconds
-
-            function getStatus() {
-                var xhttp = new XMLHttpRequest();
-                xhttp.onreadystatechange = function() {
-                    if (this.readyState == 4 && this.status == 200) {
-                        var status = JSON.parse(this.responseText);
-                        document.getElementById("led_status").innerHTML = status.led_status;
-                        document.getElementById("relay1_status").innerHTML = status.relay1_status;
-                        document.getElementById("relay2_status").innerHTML = status.relay2_status;
-                    }
-                };
-                xhttp.open("GET", "/status", true);
-                xhttp.send();
-            }
-        </script>
+        <link rel="stylesheet" href="/app.css?v={{style}}">
+        <script src="/app.js?v={{script}}"></script>
     </head>
-    <body onload="getStatus()">
+    <body onload="startStatusUpdates()">
         <div class="container">
             <h1>ESP8266 Relay and LED Control</h1>
 
@@ -82,64 +104,52 @@ def web_page():
         </div>
     </body>
     </html>"""
-    return html
+
+STYLE = CachedResponse(CSS, 'text/css', keep_alive=True, cache_control=IMMUTABLE)
+SCRIPT = CachedResponse(JS, 'application/javascript', keep_alive=True, cache_control=IMMUTABLE)
+PAGE = CachedResponse(HTML.replace('{{style}}', STYLE.hash).replace('{{script}}', SCRIPT.hash),
+                      keep_alive=True, cache_control=NO_CACHE)
 
 
-# API to return the status of relays and LED
-def get_status_json():
-    status = {
+# Status of relays and LED, serialised once per change; pages with an
+# open /events stream are told about every change
+def status_values():
+    return {
         "led_status": "ON" if led.value() == 0 else "OFF",
         "relay1_status": "ON" if relay1.value() else "OFF",
         "relay2_status": "ON" if relay2.value() else "OFF"
     }
-    return status
-
-
-# Web server setup
-addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-s = socket.socket()
-s.bind(addr)
-s.listen(5)
-
-print('Listening on', addr)
-
-# Main loop to handle client connections
-while True:
-    cl, addr = s.accept()
-    print('Client connected from', addr)
-    try:
-        request = cl.recv(1024)
-        request = str(request)
-
-        # Handle LED control
-        if '/led/on' in request:
-            led.value(0)  # Turn LED ON (active-low)
-        elif '/led/off' in request:
-            led.value(1)  # Turn LED OFF
-
-        # Handle Relay 1 control
-        if '/relay1/on' in request:
-            relay1.value(1)  # Turn Relay 1 ON
-        elif '/relay1/off' in request:
-            relay1.value(0)  # Turn Relay 1 OFF
-
-        # Handle Relay 2 control
-        if '/relay2/on' in request:
-            relay2.value(1)  # Turn Relay 2 ON
-        elif '/relay2/off' in request:
-            relay2.value(0)  # Turn Relay 2 OFF
-
-        # Serve the main web page
-        if '/status' in request:
-            response = get_status_json()
-            cl.send('HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n')
-            cl.sendall(str(response).replace("'", '"'))  # Send JSON response
-        else:
-            response = web_page()
-            cl.send('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n')
-            cl.sendall(response)
-
-    except OSError as e:
-        print('Error:', e)
-    finally:
-        cl.close()
+
+
+status = DeviceState(status_values)
+events = EventSource(status.json)
+status.on_change = events.notify
+
+
+def pin_command(pin, value):
+    def handler():
+        if pin.value() != value:
+            pin.value(value)
+            status.changed()
+        return PAGE
+    return handler
+
+
+# Request routes
+routes = Router()
+routes.add('/led/on', pin_command(led, 0))  # Turn LED ON (active-low)
+routes.add('/led/off', pin_command(led, 1))  # Turn LED OFF
+routes.add('/relay1/on', pin_command(relay1, 1))
+routes.add('/relay1/off', pin_command(relay1, 0))
+routes.add('/relay2/on', pin_command(relay2, 1))
+routes.add('/relay2/off', pin_command(relay2, 0))
+routes.add('/status', status.response)
+routes.add('/probes', webserver.probe_report)  # Stage timings (JSON)
+routes.add('/events', lambda: events.stream)
+routes.add('/', lambda: PAGE)
+routes.add('/app.css', lambda: STYLE)
+routes.add('/app.js', lambda: SCRIPT)
+
+
+# Web server: asyncio, so /events streams stay open beside normal requests
+asyncio.run(webserver.serve(webserver.routed(routes)))
@@ -0,0 +1,186 @@
+# Allocation-free request intake
+# Requests are read with readinto/recv_into into one preallocated bytearray
+# and located by offsets, so parsing creates no bytes or str objects.
+# Only the accessors that return text (path, header, ...) allocate.
+# MicroPython's bytearray has no find(), so every search is an explicit
+# index loop, and the head terminator is only looked for in new bytes.
+
+REQUEST_SIZE = 1024
+
+
+def _sock_readinto(sock, buf):
+    # CPython sockets have recv_into, MicroPython sockets readinto
+    if hasattr(sock, 'recv_into'):
+        return sock.recv_into(buf)
+    return sock.readinto(buf)
+
+
+class RequestBuffer:
+    """Raw request kept in a reusable buffer and parsed by offsets"""
+
+    def __init__(self, size=REQUEST_SIZE):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.clear()
+
+    def clear(self):
+        self.length = 0      # Bytes held in buf
+        self.scanned = 0     # Bytes already searched for the blank line
+        self.head_end = 0    # Offset past the blank line, 0 while incomplete
+        self.line_end = 0    # Offset of the request line's CRLF
+        self.method_end = 0  # Offset of the space after the method, 0 if malformed
+        self.path_end = 0    # End of the path, before any '?'
+        self.target_end = 0  # End of path and query
+
+    def _index(self, byte, start, end):
+        # Offset of the first byte in buf[start:end], or -1
+        buf = self.buf
+        for i in range(start, end):
+            if buf[i] == byte:
+                return i
+        return -1
+
+    def _eol(self, start, end):
+        # Offset of the first CRLF in buf[start:end], or -1
+        buf = self.buf
+        for i in range(start, end - 1):
+            if buf[i] == 13 and buf[i + 1] == 10:
+                return i
+        return -1
+
+    def _scan(self):
+        buf = self.buf
+        # A blank line completed by this read ends in a byte not seen before
+        i = max(self.scanned, 3)
+        length = self.length
+        while i < length:
+            if buf[i] == 10 and buf[i - 1] == 13 and buf[i - 2] == 10 and buf[i - 3] == 13:
+                break
+            i += 1
+        else:
+            self.scanned = length
+            return False
+        self.head_end = i + 1
+        self.line_end = self._eol(0, self.head_end)
+        self.method_end = self._index(32, 0, self.line_end)  # ' '
+        if self.method_end <= 0:
+            self.method_end = 0
+            return True
+        target_end = self._index(32, self.method_end + 1, self.line_end)
+        self.target_end = target_end if target_end >= 0 else self.line_end
+        query = self._index(63, self.method_end + 1, self.target_end)  # '?'
+        self.path_end = query if query >= 0 else self.target_end
+        return True
+
+    def _space(self):
+        # Whole buffer for the common first read, a slice only for the rest
+        return self.buf if not self.length else self.mv[self.length:]
+
+    def read_socket(self, sock):
+        """Blocking read of one request head; False on EOF or overflow"""
+        self.clear()
+        while not self._scan():
+            if self.length == len(self.buf):
+                return False
+            n = _sock_readinto(sock, self._space())
+            if not n:
+                return False
+            self.length += n
+        return True
+
+    async def read_stream(self, reader):
+        """Read the next request head from an asyncio stream"""
+        while not self._scan():
+            if self.length == len(self.buf):
+                return False
+            if hasattr(reader, 'readinto'):
+                n = await reader.readinto(self._space())
+            else:
+                # CPython StreamReader has no readinto
+                data = await reader.read(len(self.buf) - self.length)
+                n = len(data)
+                self.buf[self.length:self.length + n] = data
+            if not n:
+                return False
+            self.length += n
+        return True
+
+    def next(self):
+        """Drop the handled request, keeping any pipelined bytes after it"""
+        buf = self.buf
+        start = self.head_end
+        rest = self.length - start
+        for i in range(rest):
+            buf[i] = buf[start + i]
+        self.clear()
+        self.length = rest
+
+    def http11(self):
+        end = self.line_end
+        return end >= 8 and self._equals(end - 8, end, b'HTTP/1.1')
+
+    def _equals(self, start, end, text):
+        if end - start != len(text):
+            return False
+        buf = self.buf
+        for i in range(len(text)):
+            if buf[start + i] != text[i]:
+                return False
+        return True
+
+    def _header_start(self, name):
+        # Offset of the value of header `name` (lowercase bytes), or -1
+        buf = self.buf
+        size = len(name)
+        pos = self.line_end + 2
+        while pos < self.head_end - 2:
+            eol = self._eol(pos, self.head_end)
+            if eol - pos > size and buf[pos + size] == 58:  # ':'
+                for i in range(size):
+                    if buf[pos + i] | 0x20 != name[i]:
+                        break
+                else:
+                    pos += size + 1
+                    while buf[pos] == 32:
+                        pos += 1
+                    return pos
+            pos = eol + 2
+        return -1
+
+    def header_is(self, name, value):
+        """Case-insensitive header comparison without allocating"""
+        start = self._header_start(name)
+        if start < 0:
+            return False
+        buf = self.buf
+        end = self._eol(start, self.head_end)
+        while end > start and buf[end - 1] == 32:
+            end -= 1
+        if end - start != len(value):
+            return False
+        for i in range(len(value)):
+            if buf[start + i] | 0x20 != value[i] | 0x20:
+                return False
+        return True
+
+    def header(self, name, default=None):
+        """Header value as str, e.g. header(b'sec-websocket-key')"""
+        start = self._header_start(name)
+        if start < 0:
+            return default
+        end = self._eol(start, self.head_end)
+        return bytes(self.mv[start:end]).decode().strip()
+
+    @property
+    def method(self):
+        return bytes(self.mv[:self.method_end]).decode() if self.method_end else None
+
+    @property
+    def path(self):
+        return bytes(self.mv[self.method_end + 1:self.path_end]).decode() if self.method_end else None
+
+    @property
+    def query(self):
+        if self.path_end == self.target_end:
+            return ''
+        return bytes(self.mv[self.path_end + 1:self.target_end]).decode()
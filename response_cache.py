@@ -0,0 +1,109 @@
+# Pre-encoded HTTP responses
+# Each page is encoded to bytes once at startup together with its headers
+# (including Content-Length). Dynamic values are written into fixed-width
+# slots inside the same buffer, so serving a page allocates nothing new.
+#
+# Responses created with a cache_control policy also carry an ETag made of
+# a hash of the body, a per-boot tag and a version that is bumped whenever
+# a field changes. A client that sends the current ETag in If-None-Match
+# gets a short 304. Versions restart at 0 on every boot, so without the
+# boot tag a browser could match an ETag from before a reboot.
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+try:
+    import uhashlib as hashlib
+except ImportError:
+    import hashlib
+try:
+    import uos as os
+except ImportError:
+    import os
+
+NO_CACHE = 'no-cache'  # Cache, but revalidate with If-None-Match on every load
+IMMUTABLE = 'public, max-age=31536000, immutable'  # Versioned assets (?v=<hash>)
+
+_HEX = b'0123456789abcdef'
+_VERSION_WIDTH = 8
+
+# Random per boot, shared by every versioned ETag (also template.Template's)
+BOOT_TAG = binascii.hexlify(os.urandom(4)).decode()
+
+
+class CachedResponse:
+    """Complete HTTP response held once as bytes, with patchable fields"""
+
+    def __init__(self, body, content_type='text/html', fields=None, keep_alive=False,
+                 cache_control=None):
+        # fields maps a '{{name}}' marker in the body to its slot width
+        if isinstance(body, str):
+            body = body.encode()
+        # Content hash of the template, usable as an asset version in URLs
+        self.hash = binascii.hexlify(hashlib.sha1(body).digest()[:4]).decode()
+        self.fields = {}
+        for name, width in (fields or {}).items():
+            marker = b'{{' + name.encode() + b'}}'
+            pad = b' ' * width
+            offsets = []
+            pos = body.find(marker)
+            while pos >= 0:
+                body = body[:pos] + pad + body[pos + len(marker):]
+                offsets.append(pos)
+                pos = body.find(marker, pos + width)
+            self.fields[name] = (offsets, width)
+
+        connection = '' if keep_alive else 'Connection: close\r\n'
+        cache = ''
+        self.etag = None
+        if cache_control:
+            self.etag = bytearray('"{}-{}-{}"'.format(self.hash, BOOT_TAG, '0' * _VERSION_WIDTH).encode())
+            cache = 'Cache-Control: {}\r\nETag: {}\r\n'.format(cache_control, self.etag.decode())
+            not_modified = 'HTTP/1.1 304 Not Modified\r\n{}{}\r\n'.format(cache, connection).encode()
+            self.not_modified = bytearray(not_modified)
+        head = 'HTTP/1.1 200 OK\r\nContent-Type: {}\r\nContent-Length: {}\r\n{}{}\r\n'.format(
+            content_type, len(body), cache, connection).encode()
+        if cache_control:
+            # Where the ETag values start, found once while the heads are
+            # still bytes (MicroPython's bytearray has no find)
+            self._buf_etag = head.find(b'ETag: ') + 6
+            self._not_modified_etag = not_modified.find(b'ETag: ') + 6
+        self.buf = bytearray(head + body)
+        for offsets, width in self.fields.values():
+            for i in range(len(offsets)):
+                offsets[i] += len(head)
+        self.values = {}
+        self.version = 0
+
+    def set(self, name, value):
+        """Patch a field; values longer than the slot are truncated"""
+        if self.values.get(name) == value:
+            return
+        self.values[name] = value
+        offsets, width = self.fields[name]
+        data = str(value).encode()[:width]
+        for pos in offsets:
+            # Left-aligned and space padded: valid in HTML text and in JSON
+            self.buf[pos:pos + len(data)] = data
+            for i in range(pos + len(data), pos + width):
+                self.buf[i] = 32
+        self.version += 1
+        if self.etag is not None:
+            self._write_version(self.etag, 0)
+            self._write_version(self.buf, self._buf_etag)
+            self._write_version(self.not_modified, self._not_modified_etag)
+
+    def _write_version(self, buf, etag_start):
+        # Hex digits of the version sit between '-' and the closing quote
+        pos = etag_start + len(self.etag) - 2
+        value = self.version
+        for _ in range(_VERSION_WIDTH):
+            buf[pos] = _HEX[value & 0xF]
+            value >>= 4
+            pos -= 1
+
+    def respond(self, req):
+        """The full response, or 304 if the client already holds this version"""
+        if self.etag is not None and req.header_is(b'if-none-match', self.etag):
+            return self.not_modified
+        return self.buf
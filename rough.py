@@ -1,6 +1,9 @@
 import network
 from machine import Pin, PWM
 import socket
+from response_cache import CachedResponse
+from router import Router
+from request_buffer import RequestBuffer
 
 # Motor control pins setup
 motor1A = Pin(5, Pin.OUT)  # D1
@@ -62,36 +65,8 @@ def decrease_speed():
     speed = max(0, speed - 100)  # Decrement speed, min 0
     print(f"Speed decreased to: {speed}")
 
-# Web server
-def web_server():
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    s = socket.socket()
-    s.bind(addr)
-    s.listen(5)
-    print("Server is running...")
-
-    while True:
-        cl, addr = s.accept()
-        request = str(cl.recv(1024))
-
-        # Extract command from the HTTP GET request
-        if 'GET /forward' in request:
-            move_forward()
-        elif 'GET /backward' in request:
-            move_backward()
-        elif 'GET /left' in request:
-            turn_left()
-        elif 'GET /right' in request:
-            turn_right()
-        elif 'GET /stop' in request:
-            stop_car()
-        elif 'GET /accelerate' in request:
-            increase_speed()
-        elif 'GET /brake' in request:
-            decrease_speed()
-
-        # Enhanced HTML UI
-        html = """<!DOCTYPE html>
+# Enhanced HTML UI, encoded once at startup
+HTML = """<!DOCTYPE html>
 <html>
 <head>
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
@@ -168,10 +143,44 @@ def web_server():
 </body>
 </html>
 """
-        cl.send("HTTP/1.1 200 OK\n")
-        cl.send("Content-Type: text/html\n")
-        cl.send("Connection: close\n\n")
-        cl.sendall(html)
+PAGE = CachedResponse(HTML)
+
+# Commands are acked without a body; the page is only sent for /
+NO_CONTENT = b'HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n'
+NOT_FOUND = b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+def command(action):
+    def handler():
+        action()
+        return NO_CONTENT
+    return handler
+
+# Routes: the page and the commands
+routes = Router()
+routes.add('/', lambda: PAGE.buf)
+routes.add('/forward', command(move_forward))
+routes.add('/backward', command(move_backward))
+routes.add('/left', command(turn_left))
+routes.add('/right', command(turn_right))
+routes.add('/stop', command(stop_car))
+routes.add('/accelerate', command(increase_speed))
+routes.add('/brake', command(decrease_speed))
+
+# Web server
+request = RequestBuffer()  # Reused for every connection
+
+def web_server():
+    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
+    s = socket.socket()
+    s.bind(addr)
+    s.listen(5)
+    print("Server is running...")
+
+    while True:
+        cl, addr = s.accept()
+        # Run the command for this path and send its answer
+        result = routes.dispatch_buf(request) if request.read_socket(cl) else None
+        cl.sendall(result or NOT_FOUND)
         cl.close()
 
 # Setup function
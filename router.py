@@ -0,0 +1,85 @@
+# Table-driven request routing
+# Only the request line is parsed. Fixed paths are found with one dict
+# lookup, and parameterised paths like '/adjust/<motor>/<speed>' by their
+# static prefix, so headers can never trigger a route by accident.
+# Requests are matched straight from a request_buffer.RequestBuffer.
+
+def _hash(data, end):
+    # djb2 over data[:end], kept to 24 bits so it stays a small int on-device
+    h = 5381
+    for i in range(end):
+        h = ((h << 5) + h + data[i]) & 0xFFFFFF
+    return h
+
+
+def _same(data, end, key):
+    if end != len(key):
+        return False
+    for i in range(end):
+        if data[i] != key[i]:
+            return False
+    return True
+
+
+class Router:
+    """Maps (method, path) to handler(*params)"""
+
+    def __init__(self, default=None):
+        # Keyed by a hash of b'METHOD /path', so a raw request buffer can
+        # be matched without slicing it into a str
+        self.static_hashes = {}  # hash -> (key, handler)
+        self.prefix_hashes = {}  # hash -> (key, handler, param count)
+        self.default = default
+
+    def add(self, pattern, handler, method='GET'):
+        cut = pattern.find('/<')
+        if cut < 0:
+            key = (method + ' ' + pattern).encode()
+            self._add_hash(self.static_hashes, key, (key, handler))
+        else:
+            count = pattern.count('<')
+            key = (method + ' ' + pattern[:cut]).encode()
+            self._add_hash(self.prefix_hashes, key, (key, handler, count))
+
+    def _add_hash(self, table, key, entry):
+        h = _hash(key, len(key))
+        if h in table and table[h][0] != key:
+            raise ValueError('route hash collision: ' + key.decode())
+        table[h] = entry
+
+    def route(self, pattern, method='GET'):
+        """Decorator form of add()"""
+        def register(handler):
+            self.add(pattern, handler, method)
+            return handler
+        return register
+
+    def dispatch_buf(self, req):
+        """Call the handler (or the default) matching a RequestBuffer's request
+
+        Returns the handler's result, or None when nothing matches. Fixed
+        paths are matched straight from the buffer without allocating; only
+        parameterised routes build their parameter strings.
+        """
+        if not req.method_end:
+            return None
+        buf = req.buf
+        end = req.path_end
+        entry = self.static_hashes.get(_hash(buf, end))
+        if entry is not None and _same(buf, end, entry[0]):
+            return entry[1]()
+
+        h = 5381
+        for i in range(end):
+            c = buf[i]
+            if c == 47 and i > req.method_end + 1:  # '/' after the first one
+                entry = self.prefix_hashes.get(h)
+                if entry is not None and _same(buf, i, entry[0]):
+                    params = bytes(req.mv[i + 1:end]).decode().split('/')
+                    if len(params) == entry[2]:
+                        return entry[1](*params)
+            h = ((h << 5) + h + c) & 0xFFFFFF
+
+        if self.default is not None:
+            return self.default()
+        return None
@@ -1,5 +1,8 @@
 import network
 import socket
+from response_cache import CachedResponse
+from router import Router
+from request_buffer import RequestBuffer
 from machine import Pin
 
 # Connect to Wi-Fi
@@ -19,39 +22,14 @@ print(wlan.ifconfig()[0])
 led = Pin(2, Pin.OUT)  # GPIO 2(D4) INBUILT LED CONTROL
 led.value(1)
 
-# Create a web server
-addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-s = socket.socket()
-s.bind(addr)
-s.listen(1)
-
-while True:
-    cl, addr = s.accept()
-    request = cl.recv(1024)
-    request = str(request)
-
-    if 'GET /led/on' in request:
-        led.value(0)  # Turn LED on
-    elif 'GET /led/off' in request:
-        led.value(1)  # Turn LED off
-
-    # Determine the current LED status
-    if led.value() == 0:
-        status = 'on'
-    else:
-        status = 'off'
-
-    # Prepare the HTML response
-    response = f"""HTTP/1.1 200 OK
-    Content-Type: text/html
-
-    <html lang="en">
+# Light control page, encoded once at startup
+HTML = """<html lang="en">
   <head>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0" />
     <title>Light Control</title>
     <style>
-      body {{
+      body {
         font-family: Arial, sans-serif;
         display: flex;
         flex-direction: column;
@@ -60,11 +38,11 @@ while True:
         height: 100vh;
         margin: 0;
         background-color: #f4f4f9;
-      }}
-      h1 {{
+      }
+      h1 {
         color: #333;
-      }}
-      button {{
+      }
+      button {
         background-color: #007bff;
         color: white;
         padding: 10px 20px;
@@ -73,21 +51,49 @@ while True:
         border-radius: 5px;
         font-size: 16px;
         cursor: pointer;
-      }}
-      button:hover {{
+      }
+      button:hover {
         background-color: #0056b3;
-      }}
+      }
     </style>
   </head>
   <body>
     <h1>Control Your Light</h1>
-    <h2>Light is {status}</h2>
+    <h2>Light is {{status}}</h2>
     <a href="/led/on"><button id="lightOn">Turn On</button></a>
     <a href="/led/off"><button id="lightOff">Turn Off</button></a>
   </body>
 </html>
-    """
+"""
+PAGE = CachedResponse(HTML, fields={'status': 3})
+
+# LED routes
+routes = Router()
+routes.add('/led/on', lambda: led.value(0))  # Turn LED on
+routes.add('/led/off', lambda: led.value(1))  # Turn LED off
+request = RequestBuffer()  # Reused for every connection
+
+# Create a web server
+addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
+s = socket.socket()
+s.bind(addr)
+s.listen(1)
+
+while True:
+    cl, addr = s.accept()
+    if request.read_socket(cl):
+        routes.dispatch_buf(request)
+
+    # Determine the current LED status
+    if led.value() == 0:
+        status = 'on'
+    else:
+        status = 'off'
+
+    # Patch the LED status into the cached page
+    PAGE.set('status', status)
+
     # Send the response back to the client
-    cl.send(response)
+    cl.sendall(PAGE.buf)
     cl.close()
 
@@ -0,0 +1,72 @@
+# Server-Sent Events: push device state to open pages when it changes
+# One long-lived /events connection per page replaces timed /status polls.
+# The snapshot is serialised once per state change and shared by every
+# client; clients only get a message when the data actually differs.
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+MAX_CLIENTS = 3     # Concurrent /events streams (each holds a socket)
+KEEPALIVE = 15      # Seconds between comment lines that detect dead clients
+
+_HEAD = (b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+         b'Cache-Control: no-cache\r\n\r\n')
+_BUSY = b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 5\r\n\r\n'
+
+
+class EventSource:
+    """Fan-out of state snapshots to every connected /events client"""
+
+    def __init__(self, snapshot):
+        # snapshot() returns the current state as a JSON str or bytes
+        self.snapshot = snapshot
+        self.version = 0
+        self.clients = 0
+        self._changed = asyncio.Event()
+        self._data_version = -1
+        self._data = b''
+
+    def notify(self):
+        """Call after any state change; wakes every stream"""
+        self.version += 1
+        # Waiters hold the old event; later waiters get a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def message(self):
+        """Current 'data: ...' message, serialised once per version"""
+        if self._data_version != self.version:
+            data = self.snapshot()
+            if isinstance(data, str):
+                data = data.encode()
+            self._data = b'data: ' + data + b'\n\n'
+            self._data_version = self.version
+        return self._data
+
+    async def stream(self, req):
+        """Route target: hold the connection and push state changes"""
+        writer = req.writer
+        req.keep_alive = False  # No Content-Length: the stream ends with the socket
+        if self.clients >= MAX_CLIENTS:
+            writer.write(_BUSY)
+            return
+        self.clients += 1
+        try:
+            writer.write(_HEAD)
+            sent = None
+            while True:
+                # Take the event before reading the state, so a change made
+                # while draining still wakes this loop
+                changed = self._changed
+                data = self.message()
+                if data != sent:
+                    writer.write(data)
+                    sent = data
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(changed.wait(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    writer.write(b':\n\n')
+        finally:
+            self.clients -= 1
@@ -0,0 +1,97 @@
+# Streamed page templates
+# A page is compiled once, at startup, into static byte chunks and
+# '{{name}}' slots. Rendering writes the chunks straight out of the compiled
+# template and only encodes the slot values, so the memory needed for one
+# response is bounded by CHUNK_SIZE rather than by the size of the page.
+# Passing the source as a bytes literal from a frozen module keeps the
+# chunks in flash: they are memoryviews into the source, never copies.
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+try:
+    import uhashlib as hashlib
+except ImportError:
+    import hashlib
+from response_cache import BOOT_TAG
+
+CHUNK_SIZE = 512  # Largest single write; also the most the socket buffers
+
+
+class Template:
+    """Page compiled into static chunks and named value slots"""
+
+    def __init__(self, source, content_type='text/html', keep_alive=True,
+                 cache_control=None, chunk_size=CHUNK_SIZE):
+        if isinstance(source, str):
+            source = source.encode()
+        self.source = source
+        self.hash = binascii.hexlify(hashlib.sha1(source).digest()[:4]).decode()
+        self.parts = []  # memoryview chunks and slot names (str)
+        self.static_length = 0
+        view = memoryview(source)
+        pos = 0
+        while True:
+            start = source.find(b'{{', pos)
+            end = source.find(b'}}', start) if start >= 0 else -1
+            text_end = start if end >= 0 else len(source)
+            while pos < text_end:
+                cut = min(pos + chunk_size, text_end)
+                self.parts.append(view[pos:cut])
+                self.static_length += cut - pos
+                pos = cut
+            if end < 0:
+                break
+            self.parts.append(bytes(view[start + 2:end]).decode().strip())
+            pos = end + 2
+
+        connection = '' if keep_alive else 'Connection: close\r\n'
+        self.cache_control = cache_control
+        self.head_start = 'HTTP/1.1 200 OK\r\nContent-Type: {}\r\n{}'.format(
+            content_type, connection).encode()
+        if cache_control:
+            self.not_modified_start = 'HTTP/1.1 304 Not Modified\r\nCache-Control: {}\r\n{}'.format(
+                cache_control, connection).encode()
+
+    def etag(self, version):
+        # State versions restart on every boot; the boot tag tells them apart
+        return '"{}-{}-{:08x}"'.format(self.hash, BOOT_TAG, version).encode()
+
+    def pieces(self, values, req=None, version=None):
+        """Yield the response in order: headers, then chunks and values
+
+        With a cache_control policy and a state version, a request whose
+        If-None-Match holds the current ETag gets only a 304 head.
+        """
+        cache = b''
+        if self.cache_control and version is not None:
+            etag = self.etag(version)
+            if req is not None and req.header_is(b'if-none-match', etag):
+                yield self.not_modified_start + b'ETag: ' + etag + b'\r\n\r\n'
+                return
+            cache = b'Cache-Control: ' + self.cache_control.encode() + b'\r\nETag: ' + etag + b'\r\n'
+
+        encoded = {}
+        length = self.static_length
+        for part in self.parts:
+            if isinstance(part, str):
+                value = encoded.get(part)
+                if value is None:
+                    value = encoded[part] = str(values[part]).encode()
+                length += len(value)
+
+        yield self.head_start + cache + 'Content-Length: {}\r\n\r\n'.format(length).encode()
+        for part in self.parts:
+            yield encoded[part] if isinstance(part, str) else part
+
+    async def render(self, req, values, version=None):
+        """Stream the page to an asyncio request, draining after each piece"""
+        writer = req.writer
+        for piece in self.pieces(values, req, version):
+            writer.write(piece)
+            await writer.drain()
+
+    def send(self, sock, values, req=None, version=None):
+        """Blocking-socket version of render()"""
+        for piece in self.pieces(values, req, version):
+            sock.sendall(piece)
@@ -0,0 +1,139 @@
+# Shared asyncio HTTP/1.1 server with persistent (keep-alive) connections
+# Every response must carry Content-Length so the browser can reuse the
+# socket for the next button press instead of doing a new TCP handshake.
+import gc
+from probes import Probes
+from request_buffer import RequestBuffer
+from response_cache import CachedResponse
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+MAX_IDLE = 3        # Idle keep-alive connections allowed at once (RAM guard)
+IDLE_TIMEOUT = 5    # Seconds an idle connection may wait for its next request
+
+_idle = []  # Tasks of connections waiting for their next request, oldest first
+
+# Per-stage timings: connection setup, reading the first request of a
+# connection (later keep-alive reads would time the user's think time),
+# running the handler and draining the response
+ACCEPT, RECV, DISPATCH, SEND = range(4)
+probes = Probes(('accept', 'recv', 'dispatch', 'send'))
+
+
+class Request(RequestBuffer):
+    """Current request of a connection; the buffer is reused for the next one"""
+
+    def __init__(self, reader, writer):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.keep_alive = True
+
+
+def response(body, content_type='text/html', status='200 OK'):
+    """Encode a complete response with Content-Length framing"""
+    if isinstance(body, str):
+        body = body.encode()
+    head = 'HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'.format(
+        status, content_type, len(body))
+    return head.encode() + body
+
+
+NOT_FOUND = response(b'Not Found', 'text/plain', '404 Not Found')
+NO_CONTENT = b'HTTP/1.1 204 No Content\r\n\r\n'  # Ack for commands: no body to send
+
+
+def probe_report():
+    """Route target: the stage timings as JSON"""
+    return response(probes.report(), 'application/json')
+
+
+def routed(routes):
+    """Request handler dispatching through a router.Router
+
+    Route handlers return the response bytes, a CachedResponse (answered
+    with 304 when the client's ETag is current), or a coroutine function
+    that is awaited with the request to take the connection over.
+    """
+    async def handler(req):
+        result = routes.dispatch_buf(req)
+        if result is None:
+            req.writer.write(NOT_FOUND)
+        elif isinstance(result, CachedResponse):
+            req.writer.write(result.respond(req))
+        elif callable(result):
+            await result(req)
+        else:
+            req.writer.write(result)
+    return handler
+
+
+async def _read_request(req):
+    if not await req.read_stream(req.reader) or not req.method_end:
+        return False
+
+    # HTTP/1.1 stays open unless asked otherwise, HTTP/1.0 only on request
+    if req.http11():
+        req.keep_alive = not req.header_is(b'connection', b'close')
+    else:
+        req.keep_alive = req.header_is(b'connection', b'keep-alive')
+    return True
+
+
+async def _serve_client(handler, reader, writer):
+    t = probes.start()
+    gc.collect()
+    req = Request(reader, writer)
+    task = asyncio.current_task()
+    t = probes.mark(ACCEPT, t)
+    first = True
+    try:
+        while True:
+            # Park as idle; evict the oldest idle connection past the cap
+            _idle.append(task)
+            if len(_idle) > MAX_IDLE:
+                _idle.pop(0).cancel()
+            try:
+                ok = await asyncio.wait_for(_read_request(req), IDLE_TIMEOUT)
+            finally:
+                if task in _idle:
+                    _idle.remove(task)
+            if not ok:
+                break
+            if first:
+                t = probes.mark(RECV, t)
+                first = False
+            else:
+                t = probes.start()
+
+            await handler(req)
+            if not req.keep_alive:
+                # Also where streams (WebSocket, SSE) end: their handler
+                # time is a session length, not a dispatch time
+                await writer.drain()
+                break
+            t = probes.mark(DISPATCH, t)
+            await writer.drain()
+            probes.mark(SEND, t)
+            req.next()
+    except (asyncio.TimeoutError, asyncio.CancelledError, OSError):
+        pass
+    except Exception as e:
+        print("Connection handling error:", e)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def serve(handler, host='0.0.0.0', port=80):
+    """Run handler(req) for every request; it writes its reply to req.writer"""
+    server = await asyncio.start_server(
+        lambda reader, writer: _serve_client(handler, reader, writer), host, port)
+    print("Server is running...")
+    while True:
+        await asyncio.sleep(3600)
@@ -0,0 +1,105 @@
+# Minimal WebSocket (RFC 6455) server side for the asyncio web server
+# Only what the control UIs need: the upgrade handshake, small binary/text
+# frames from the browser and unmasked frames back to it.
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+try:
+    import uhashlib as hashlib
+except ImportError:
+    import hashlib
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_PAYLOAD = 125  # Control frames only; larger frames are refused
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    if isinstance(key, str):
+        key = key.encode()
+    return binascii.b2a_base64(hashlib.sha1(key + GUID).digest()).strip()
+
+
+def is_upgrade(req):
+    return req.header_is(b'upgrade', b'websocket')
+
+
+def frame(payload, opcode=OP_BINARY):
+    """Encode one unmasked server frame (payload up to 125 bytes)"""
+    return bytes((0x80 | opcode, len(payload))) + payload
+
+
+class WebSocket:
+    """Connection after a successful upgrade"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.open = True
+
+    async def recv(self):
+        """Next (opcode, payload) data frame, or None once the peer closes"""
+        try:
+            return await self._recv()
+        except EOFError:
+            # Dropped without a close frame (IncompleteReadError on CPython)
+            self.open = False
+            return None
+
+    async def _recv(self):
+        while self.open:
+            head = await self.reader.readexactly(2)
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length > MAX_PAYLOAD or not head[1] & 0x80:
+                # Oversized or unmasked client frame: protocol error
+                await self.close(1002)
+                return None
+            mask = await self.reader.readexactly(4)
+            payload = bytearray(await self.reader.readexactly(length))
+            for i in range(length):
+                payload[i] ^= mask[i & 3]
+
+            if opcode == OP_PING:
+                self.writer.write(frame(payload, OP_PONG))
+                await self.writer.drain()
+            elif opcode == OP_CLOSE:
+                await self.close()
+                return None
+            elif opcode in (OP_TEXT, OP_BINARY):
+                return opcode, payload
+        return None
+
+    def send(self, payload, opcode=OP_BINARY):
+        """Queue a frame; the caller awaits writer.drain() when it suits it"""
+        if self.open:
+            self.writer.write(frame(payload, opcode))
+
+    async def close(self, code=1000):
+        if self.open:
+            self.open = False
+            self.writer.write(frame(bytes((code >> 8, code & 0xFF)), OP_CLOSE))
+            await self.writer.drain()
+
+
+async def accept(req):
+    """Answer the upgrade request and return the WebSocket"""
+    key = req.header(b'sec-websocket-key')
+    if not key or not is_upgrade(req):
+        req.writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        return None
+    req.writer.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                     b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept_key(key) + b'\r\n\r\n')
+    await req.writer.drain()
+    # The socket now speaks WebSocket framing; never reuse it for HTTP
+    req.keep_alive = False
+    return WebSocket(req.reader, req.writer)